@@ -1,8 +1,15 @@
 import os
+import hmac
+import secrets
 import importlib
 import asyncio
 import logging
+import signal
+import time
+import traceback
 from typing import Dict, Any
+from urllib.parse import urlparse
+from aiohttp import web
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -12,7 +19,10 @@ from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
 )
-from plugins.db import db, send_log, send_error_to_support  # for error reporting
+from plugins.db import db, send_log, send_error_to_support, ensure_indexes, find_collection_scans, flush_notifications  # for error reporting
+from plugins.outbound import OutboundScheduler
+from plugins.lazy import LazyPlugin, load_manifest
+from plugins.metrics import snapshot_handlers, added_handlers, instrument_handlers
 
 # ----------- Logging -----------
 logging.basicConfig(
@@ -26,8 +36,24 @@ load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 SUPPORT_CHAT_ID=os.getenv("SUPPORT_CHAT_ID")
 
+# Webhook mode is used when WEBHOOK_URL is set, polling otherwise
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or urlparse(WEBHOOK_URL or "").path or "/webhook"
+# Set to 0 to skip setWebhook, e.g. when POSTing recorded updates locally
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") != "0"
+
 
 PLUGINS: Dict[str, Dict[str, Any]] = {}
+MODULES: Dict[str, Any] = {}  # Loaded plugin modules, for shutdown hooks
+STARTUP_REPORT: Dict[str, Dict[str, Any]] = {}  # Per-plugin status and phase timings
+
+# Per-plugin limits for each loader phase, in seconds
+PLUGIN_IMPORT_TIMEOUT = float(os.getenv("PLUGIN_IMPORT_TIMEOUT", "30"))
+PLUGIN_TEST_TIMEOUT = float(os.getenv("PLUGIN_TEST_TIMEOUT", "15"))
+PLUGIN_STARTUP_TIMEOUT = float(os.getenv("PLUGIN_STARTUP_TIMEOUT", "60"))
 
 # ----------- Static Text Loaders -----------
 def load_text_file(filename: str) -> str:
@@ -41,42 +67,161 @@ ABOUT_TEXT = load_text_file("about.txt")
 HELP_HEADER = load_text_file("help.txt")
 WELCOME_TEXT = load_text_file("welcome.txt")
 
+# ----------- Index Bootstrap -----------
+async def bootstrap_indexes(name: str, module) -> None:
+    """Reconcile a plugin's declared INDEXES and explain its declared QUERIES."""
+    if hasattr(module, "prepare_indexes"):
+        # e.g. removing duplicates before a unique index is built
+        await module.prepare_indexes()
+    for action in await ensure_indexes(getattr(module, "INDEXES", {})):
+        logging.info(f"🗂 Plugin {name} index: {action}")
+    for scan in await find_collection_scans(getattr(module, "QUERIES", {})):
+        logging.warning(f"🐢 Plugin {name} still scans: {scan}")
+
 # ----------- Async Plugin Loader -----------
+def format_startup_report() -> str:
+    """One MarkdownV2 message summarising every plugin's load timings."""
+    loaded = sum(1 for entry in STARTUP_REPORT.values() if entry["status"] == "ok")
+    lazy = sum(1 for entry in STARTUP_REPORT.values() if entry["status"] == "lazy")
+    lines = [f"{'plugin':<18}{'import':>8}{'setup':>8}{'test':>8}{'init':>8}"]
+    for name, entry in STARTUP_REPORT.items():
+        timings = "".join(
+            f"{entry[phase] * 1000:>6.0f}ms" if phase in entry else f"{'-':>8}"
+            for phase in ("import", "setup", "test", "init")
+        )
+        mark = {"ok": "✅", "lazy": "💤"}.get(entry["status"], "❌")
+        lines.append(f"{name[:17]:<18}{timings} {mark}")
+    table = "\n".join(lines)
+    return (
+        f"🧩 *Plugins loaded:* {loaded}/{len(STARTUP_REPORT)}, *lazy:* {lazy}\n"
+        f"```\n{table}\n```"
+    )
+
 async def load_plugins(app: Application) -> None:
     global PLUGINS
     PLUGINS.clear()
+    MODULES.clear()
+    STARTUP_REPORT.clear()
     plugin_dir = "plugins"
     if not os.path.isdir(plugin_dir):
         return
 
-    import traceback
+    names = sorted(
+        file[:-3] for file in os.listdir(plugin_dir)
+        if file.endswith(".py") and file != "__init__.py"
+    )
+    for name in names:
+        STARTUP_REPORT[name] = {"status": "pending"}
+
+    async def init_lazy_plugin(name: str, module) -> None:
+        # Lazy plugins skip the boot-time test(); the rest of init runs on first use
+        if hasattr(module, "INDEXES") or hasattr(module, "QUERIES"):
+            await bootstrap_indexes(name, module)
+        if hasattr(module, "startup"):
+            await module.startup(app)
+        MODULES[name] = module
+        if hasattr(module, "get_info"):
+            PLUGINS[name] = module.get_info() or {}
 
-    for file in os.listdir(plugin_dir):
-        if file.endswith(".py") and file != "__init__.py":
-            name = file[:-3]
+    # Plugins listed in the manifest get stub handlers and are imported on first use
+    manifest = load_manifest()
+    for name in [name for name in names if name in manifest]:
+        lazy_plugin = LazyPlugin(app, name, manifest[name], package=plugin_dir, on_load=init_lazy_plugin)
+        lazy_plugin.register()
+        PLUGINS[name] = lazy_plugin.get_info()
+        STARTUP_REPORT[name]["status"] = "lazy"
+    names = [name for name in names if name not in manifest]
+
+    async def timed(name: str, phase: str, awaitable, timeout: float):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{phase} timed out after {timeout:g}s")
+        finally:
+            STARTUP_REPORT[name][phase] = time.perf_counter() - started
+
+    async def fail(name: str, what: str, error: BaseException) -> None:
+        STARTUP_REPORT[name]["status"] = "failed"
+        trace = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        await send_error_to_support(
+            f"*❌ Plugin `{name}` {what}:*\n`{error}`\n```{trace}```"
+        )
+
+    # Imports run concurrently in worker threads
+    modules = await asyncio.gather(
+        *(timed(name, "import",
+                asyncio.to_thread(importlib.import_module, f"{plugin_dir}.{name}"),
+                PLUGIN_IMPORT_TIMEOUT)
+          for name in names),
+        return_exceptions=True
+    )
+
+    # setup() registers handlers, so it runs in name order to keep that deterministic
+    ready = []
+    for name, module in zip(names, modules):
+        if isinstance(module, BaseException):
+            await fail(name, "load error", module)
+            continue
+        started = time.perf_counter()
+        try:
+            if hasattr(module, "setup"):
+                before = snapshot_handlers(app)
+                module.setup(app)
+                # Every handler a plugin registers gets latency/error metrics
+                instrument_handlers(name, added_handlers(app, before))
+        except Exception as e:
+            await fail(name, "load error", e)
+            continue
+        finally:
+            STARTUP_REPORT[name]["setup"] = time.perf_counter() - started
+        ready.append((name, module))
+
+    async def init_plugin(name: str, module) -> None:
+        if hasattr(module, "test"):
             try:
-                module = importlib.import_module(f"{plugin_dir}.{name}")
+                await timed(name, "test", module.test(), PLUGIN_TEST_TIMEOUT)
+            except Exception as test_err:
+                await fail(name, "test failed", test_err)
+                return
+
+        async def init() -> None:
+            if hasattr(module, "INDEXES") or hasattr(module, "QUERIES"):
+                await bootstrap_indexes(name, module)
+            if hasattr(module, "startup"):
+                await module.startup(app)
 
-                if hasattr(module, "setup"):
-                    module.setup(app)
+        try:
+            await timed(name, "init", init(), PLUGIN_STARTUP_TIMEOUT)
+            if hasattr(module, "get_info"):
+                PLUGINS[name] = module.get_info() or {}
+        except Exception as e:
+            await fail(name, "load error", e)
+            return
 
-                if hasattr(module, "test"):
-                    try:
-                        await module.test()
-                        await send_log(f"✅ *Plugin loaded:* `{name}`")
-                    except Exception as test_err:
-                        await send_error_to_support(
-                            f"*❌ Plugin `{name}` test failed:*\n`{test_err}`\n```{traceback.format_exc()}```"
-                        )
-                        continue
+        MODULES[name] = module
+        STARTUP_REPORT[name]["status"] = "ok"
 
-                if hasattr(module, "get_info"):
-                    PLUGINS[name] = module.get_info() or {}
+    # Tests, index bootstrap and startup hooks run concurrently across plugins
+    await asyncio.gather(*(init_plugin(name, module) for name, module in ready))
 
+    for name, entry in STARTUP_REPORT.items():
+        logging.info(
+            f"🧩 Plugin {name}: {entry['status']} "
+            + " ".join(f"{phase}={entry[phase] * 1000:.0f}ms"
+                       for phase in ("import", "setup", "test", "init") if phase in entry)
+        )
+    await send_log(format_startup_report())
+
+async def shutdown_plugins(app: Application) -> None:
+    for name, module in MODULES.items():
+        if hasattr(module, "shutdown"):
+            try:
+                await module.shutdown(app)
             except Exception as e:
-                await send_error_to_support(
-                    f"*❌ Plugin `{name}` load error:*\n`{e}`\n```{traceback.format_exc()}```"
-                )
+                logging.error(f"❌ Plugin {name} shutdown error: {e}")
+    # Last, so reports raised by plugin shutdowns still reach the support chat
+    await flush_notifications()
 
 # ----------- UI Markups -----------
 def build_main_menu_markup() -> InlineKeyboardMarkup:
@@ -146,12 +291,80 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 
+# ----------- Webhook Mode -----------
+def webhook_secret() -> str:
+    """The configured secret; one is generated when the bot registers the webhook itself."""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    if not WEBHOOK_REGISTER:
+        # Whoever registers the webhook must set the same secret, or anyone could post updates
+        raise RuntimeError("❌ WEBHOOK_SECRET is required when WEBHOOK_REGISTER=0.")
+    return secrets.token_urlsafe(32)
+
+def build_webhook_app(application: Application, secret: str) -> web.Application:
+    """aiohttp app that verifies the secret token and feeds updates to the Application."""
+    async def receive_update(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, secret):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception:
+            return web.Response(status=400)
+        # Processing happens in the Application; Telegram only needs a quick 200
+        await application.update_queue.put(update)
+        return web.Response()
+
+    web_app = web.Application()
+    web_app.router.add_post(WEBHOOK_PATH, receive_update)
+    return web_app
+
+async def run_webhook(application: Application) -> None:
+    """Serve the webhook until SIGINT/SIGTERM, mirroring run_polling's lifecycle."""
+    secret = webhook_secret()
+    runner = web.AppRunner(build_webhook_app(application, secret))
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+
+    if WEBHOOK_REGISTER:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL, secret_token=secret, allowed_updates=Update.ALL_TYPES
+        )
+    logging.info(f"🌐 Webhook listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
 # ----------- Main Function -----------
 def main():
     if not TOKEN:
         raise RuntimeError("❌ BOT_TOKEN is not set.")
 
-    application = ApplicationBuilder().token(TOKEN).concurrent_updates(True).build()
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .rate_limiter(OutboundScheduler())
+        .build()
+    )
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -166,12 +379,17 @@ def main():
             parse_mode="HTML"
         )
 
-    # Set post-init tasks
+    # Set post-init and shutdown tasks
     application.post_init = post_init
+    application.post_shutdown = shutdown_plugins
 
     print("🚀 Bot is starting...")
     logging.info("🚀 Bot is running.")
-    application.run_polling()
+    if WEBHOOK_URL:
+        asyncio.run(run_webhook(application))
+    else:
+        # chat_member updates are opt-in; the admin cache relies on them
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+"""
+Activity Tracker Plugin for LunaBot
+Records every user/chat interaction in memory and writes it behind in
+batches, so activity data is accurate without a Mongo write per update
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from telegram import Update
+from telegram.ext import Application, TypeHandler, ContextTypes
+from .db import db, get_collection, send_error_to_support
+from .breaker import STORAGE_ERRORS, is_transient_write_error, mongo_breaker
+from .journal import journaled_bulk_write
+from . import stats
+
+# Collections; activity counters are analytics, so writes skip the journal wait
+users_collection = get_collection("users", write_concern="fast")
+groups_collection = get_collection("groups", write_concern="fast")
+
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "10"))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "500"))
+
+# Runs before every plugin handler group; handlers in other groups still run
+ACTIVITY_HANDLER_GROUP = -100
+
+logger = logging.getLogger(__name__)
+
+class ActivityTracker:
+    def __init__(self):
+        self.users = {}  # user_id -> pending aggregate
+        self.chats = {}  # chat_id -> pending aggregate
+        self._flush_lock = asyncio.Lock()
+
+    def pending(self) -> int:
+        return len(self.users) + len(self.chats)
+
+    def is_flushing(self) -> bool:
+        return self._flush_lock.locked()
+
+    def _requeue(self, kind: str, entries: dict) -> None:
+        # Put back aggregates a failed write didn't apply, under any activity
+        # recorded since; the newer entry keeps its last_seen and names
+        target = self.users if kind == "users" else self.chats
+        counter = "count" if kind == "users" else "messages"
+        for key, entry in entries.items():
+            current = target.get(key)
+            if current is None:
+                target[key] = entry
+            else:
+                current[counter] += entry[counter]
+
+    def record(self, update: Update) -> None:
+        """
+        Fold one update into the pending aggregates
+        """
+        now = datetime.utcnow()
+        user = update.effective_user
+        chat = update.effective_chat
+
+        if user and not user.is_bot:
+            entry = self.users.setdefault(user.id, {"count": 0})
+            entry["count"] += 1
+            entry["last_seen"] = now
+            entry["username"] = user.username
+            entry["first_name"] = user.first_name
+            entry["last_name"] = user.last_name
+
+        if chat and chat.type in ("group", "supergroup"):
+            entry = self.chats.setdefault(chat.id, {"messages": 0})
+            if update.effective_message:
+                entry["messages"] += 1
+            entry["last_activity"] = now
+            entry["chat_title"] = chat.title
+            entry["chat_type"] = chat.type
+
+    def _build_operations(self, users: dict, chats: dict) -> tuple:
+        # Registration stays with user_management.handle_start, so user
+        # activity only updates users that already exist
+        user_ops = [
+            UpdateOne(
+                {"user_id": user_id},
+                {
+                    "$set": {
+                        "last_seen": entry["last_seen"],
+                        "username": entry["username"],
+                        "first_name": entry["first_name"],
+                        "last_name": entry["last_name"]
+                    },
+                    "$inc": {"interaction_count": entry["count"]}
+                }
+            )
+            for user_id, entry in users.items()
+        ]
+        chat_ops = [
+            UpdateOne(
+                {"chat_id": chat_id},
+                {
+                    "$set": {
+                        "last_activity": entry["last_activity"],
+                        "chat_title": entry["chat_title"],
+                        "chat_type": entry["chat_type"]
+                    },
+                    "$inc": {"message_count": entry["messages"]}
+                },
+                upsert=True
+            )
+            for chat_id, entry in chats.items()
+        ]
+        return user_ops, chat_ops
+
+    async def flush(self) -> int:
+        """
+        Write pending aggregates with unordered bulk upserts, in batches
+        """
+        async with self._flush_lock:
+            users, self.users = self.users, {}
+            chats, self.chats = self.chats, {}
+            if not users and not chats:
+                return 0
+
+            user_ops, chat_ops = self._build_operations(users, chats)
+            error = None
+            for kind, collection, entries, operations in (
+                ("users", users_collection, users, user_ops),
+                ("chats", groups_collection, chats, chat_ops)
+            ):
+                # Operations are built in the same order as the aggregates
+                keys = list(entries)
+                for start in range(0, len(operations), ACTIVITY_BATCH_SIZE):
+                    try:
+                        await journaled_bulk_write(
+                            collection, operations[start:start + ACTIVITY_BATCH_SIZE], ordered=False
+                        )
+                    except BulkWriteError as e:
+                        # The rest of an unordered batch was applied; retry only what
+                        # failed for a reason that may pass, a rejected document never will
+                        write_errors = e.details["writeErrors"]
+                        retry = [keys[start + write_error["index"]]
+                                 for write_error in write_errors if is_transient_write_error(write_error)]
+                        self._requeue(kind, {key: entries[key] for key in retry})
+                        if len(retry) < len(write_errors):
+                            logger.error(f"Activity flush dropped {len(write_errors) - len(retry)} rejected {kind} writes")
+                        error = error or e
+                    except STORAGE_ERRORS as e:
+                        self._requeue(kind, {key: entries[key] for key in keys[start:]})
+                        error = error or e
+                        break
+                    except Exception as e:
+                        # Not a storage outage, so retrying the same batch would fail the same way
+                        logger.error(f"Activity flush dropped {len(keys[start:start + ACTIVITY_BATCH_SIZE])} {kind} aggregates: {e}")
+                        error = error or e
+            if error is not None:
+                raise error
+
+            # The top-users refresh reads Mongo; it catches up on a later flush
+            if users and not mongo_breaker.is_open:
+                await stats.record_activity(users.keys())
+            return len(user_ops) + len(chat_ops)
+
+tracker = ActivityTracker()
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Record the interaction; flush early once a full batch is pending
+    """
+    tracker.record(update)
+    if tracker.pending() >= ACTIVITY_BATCH_SIZE and not tracker.is_flushing():
+        context.application.create_task(flush_activity(), update=update)
+
+async def flush_activity() -> None:
+    try:
+        written = await tracker.flush()
+        if written:
+            logger.debug(f"Activity flush wrote {written} documents")
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Activity Flush Error:*\n`{str(e)}`"
+        )
+
+async def flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await flush_activity()
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(TypeHandler(Update, track_activity), group=ACTIVITY_HANDLER_GROUP)
+    app.job_queue.run_repeating(
+        flush_job,
+        interval=ACTIVITY_FLUSH_INTERVAL,
+        first=ACTIVITY_FLUSH_INTERVAL,
+        name="activity_flush"
+    )
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+async def shutdown(app: Application) -> None:
+    """
+    Write whatever is still pending before the process exits
+    """
+    await flush_activity()
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Activity Tracker",
+        "description": "Batched tracking of user and group activity",
+        "version": "1.0.0"
+    }
@@ -0,0 +1,117 @@
+"""
+Admin Cache Plugin for LunaBot
+Per-chat administrator lists fetched with one get_chat_administrators call,
+kept warm by a background refresh and invalidated by chat member updates,
+so admin checks in moderation commands cost no Bot API round trip
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Optional
+from telegram import Bot, ChatMember, ChatMemberAdministrator, Update
+from telegram.constants import ChatMemberStatus
+from telegram.ext import Application, ChatMemberHandler, ContextTypes
+from .cache import ReadThroughCache
+
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "900"))
+ADMIN_REFRESH_INTERVAL = float(os.getenv("ADMIN_REFRESH_INTERVAL", "300"))
+# Chats without an admin check for this long drop out of the background refresh
+ADMIN_IDLE_SECONDS = float(os.getenv("ADMIN_IDLE_SECONDS", "3600"))
+
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+logger = logging.getLogger(__name__)
+
+# Admin lists come from the Bot API, so a Mongo outage is no reason to keep
+# trusting an expired one: a demoted admin must lose rights on time
+admins_cache = ReadThroughCache("chat_admins", ADMIN_CACHE_TTL, max_size=5000, serve_stale=False)
+_last_used: Dict[int, float] = {}
+
+async def _fetch_admins(bot: Bot, chat_id: int) -> Dict[int, ChatMember]:
+    members = await bot.get_chat_administrators(chat_id)
+    return {member.user.id: member for member in members}
+
+async def get_admins(bot: Bot, chat_id: int) -> Dict[int, ChatMember]:
+    """
+    Administrators of a chat by user id, from the cache when possible
+    """
+    _last_used[chat_id] = time.monotonic()
+    return await admins_cache.get(chat_id, lambda: _fetch_admins(bot, chat_id))
+
+async def get_admin(bot: Bot, chat_id: int, user_id: int) -> Optional[ChatMember]:
+    return (await get_admins(bot, chat_id)).get(user_id)
+
+async def is_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
+    return user_id in await get_admins(bot, chat_id)
+
+async def bot_can_restrict(bot: Bot, chat_id: int) -> bool:
+    """
+    Whether the bot itself may mute/ban members in the chat
+    """
+    member = await get_admin(bot, chat_id, bot.id)
+    if member is None:
+        return False
+    return member.status == ChatMemberStatus.OWNER or (
+        isinstance(member, ChatMemberAdministrator) and member.can_restrict_members
+    )
+
+def invalidate(chat_id: int) -> None:
+    admins_cache.invalidate(chat_id)
+
+async def track_admin_changes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Drop a chat's cached admins when someone is promoted, demoted or their
+    rights change, including the bot itself
+    """
+    change = update.chat_member or update.my_chat_member
+    if change is None:
+        return
+    old, new = change.old_chat_member, change.new_chat_member
+    if old.status in ADMIN_STATUSES or new.status in ADMIN_STATUSES:
+        invalidate(change.chat.id)
+
+async def refresh_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Re-fetch admins of recently used chats before their entries expire
+    """
+    cutoff = time.monotonic() - ADMIN_IDLE_SECONDS
+    for chat_id, used in list(_last_used.items()):
+        if used < cutoff:
+            del _last_used[chat_id]
+            invalidate(chat_id)
+            continue
+        try:
+            admins_cache.prime(chat_id, await _fetch_admins(context.bot, chat_id))
+        except Exception as e:
+            # The bot may have been removed; the next check refetches or fails loudly
+            logger.warning(f"Admin refresh failed for chat {chat_id}: {e}")
+            invalidate(chat_id)
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(ChatMemberHandler(track_admin_changes, ChatMemberHandler.ANY_CHAT_MEMBER))
+    app.job_queue.run_repeating(
+        refresh_job,
+        interval=ADMIN_REFRESH_INTERVAL,
+        first=ADMIN_REFRESH_INTERVAL,
+        name="admin_cache_refresh"
+    )
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    pass
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Admin Cache",
+        "description": "Cached chat administrator lists for moderation checks",
+        "version": "1.0.0"
+    }
@@ -0,0 +1,135 @@
+"""
+Mongo Circuit Breaker for LunaBot
+Bounds every guarded Mongo call by MONGO_OP_TIMEOUT and stops sending calls
+after repeated failures, so handlers fail fast (or fall back to the write
+journal and caches) instead of waiting out a server selection timeout
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+import pymongo
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+MONGO_OP_TIMEOUT = float(os.getenv("MONGO_OP_TIMEOUT", "2"))
+# Consecutive failures that open the breaker, and how long it stays open
+# before a single probe call is let through
+MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", "3"))
+MONGO_BREAKER_RESET = float(os.getenv("MONGO_BREAKER_RESET", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+logger = logging.getLogger(__name__)
+
+class BreakerOpen(Exception):
+    """
+    Raised instead of calling Mongo while the breaker is open
+    """
+
+# Failures that say nothing about the request itself, only that Mongo is
+# unreachable or too slow; AutoReconnect, NetworkTimeout and
+# ServerSelectionTimeoutError are all ConnectionFailure subclasses, and
+# ExecutionTimeout is the server giving up at the operation deadline
+TRANSIENT_ERRORS = (asyncio.TimeoutError, ConnectionFailure, ExecutionTimeout)
+# What a caller catches to fall back to degraded behaviour
+STORAGE_ERRORS = (BreakerOpen,) + TRANSIENT_ERRORS
+# Write error codes in a BulkWriteError that are worth retrying: the server
+# was unreachable, stepping down or out of time, not rejecting the document
+TRANSIENT_WRITE_CODES = {
+    6, 7, 50, 89, 91, 112, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436
+}
+
+def is_transient_write_error(write_error: dict) -> bool:
+    return write_error.get("code") in TRANSIENT_WRITE_CODES
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = MONGO_BREAKER_FAILURES, reset: float = MONGO_BREAKER_RESET,
+                 timeout: float = MONGO_OP_TIMEOUT):
+        self.name = name
+        self.max_failures = failures
+        self.reset = reset
+        self.timeout = timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._listeners: List[Callable[[str], None]] = []
+
+    def on_change(self, listener: Callable[[str], None]) -> None:
+        self._listeners.append(listener)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        logger.warning(f"Circuit breaker {self.name} is now {state}")
+        for listener in self._listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                logger.error(f"Circuit breaker listener failed: {e}")
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset:
+                return False
+            self._set_state(HALF_OPEN)
+        # Half open: exactly one probe at a time decides whether to close
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._probing = False
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self.trips += 1
+            self._set_state(OPEN)
+
+    async def call(self, factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Await factory() under the breaker and the operation timeout. Raises
+        BreakerOpen without calling it while the breaker is open.
+        """
+        if not self.allow():
+            raise BreakerOpen(f"{self.name} is unavailable")
+        limit = timeout or self.timeout
+        try:
+            # pymongo.timeout sets the same deadline inside the driver (Motor
+            # copies the context into its executor), so a call abandoned by
+            # wait_for doesn't keep its pooled socket busy until socketTimeoutMS
+            with pymongo.timeout(limit):
+                result = await asyncio.wait_for(factory(), limit)
+        except TRANSIENT_ERRORS:
+            self.record_failure()
+            raise
+        except Exception:
+            # Mongo answered, just not with a result (e.g. DuplicateKeyError)
+            self.record_success()
+            raise
+        except BaseException:
+            self._probing = False
+            raise
+        self.record_success()
+        return result
+
+mongo_breaker = CircuitBreaker("mongo")
@@ -0,0 +1,158 @@
+"""
+Read-Through Cache for LunaBot
+TTL + LRU cache for hot Mongo documents. Concurrent misses for the same key
+share one query, and write paths invalidate (or prime) entries explicitly.
+While Mongo is unavailable, expired entries keep being served, unless the
+cache was created with serve_stale=False.
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from .breaker import STORAGE_ERRORS, mongo_breaker
+
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+# Set CACHE_ENABLED=0 to send every read straight to Mongo
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+# How long a None result is cached; short, so a document created by another
+# process (or a write path that forgot to invalidate) shows up quickly
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "5"))
+
+# Every cache by name, for the metrics exporter
+CACHES: Dict[str, "ReadThroughCache"] = {}
+
+class ReadThroughCache:
+    """
+    Values are returned as stored and shared between callers, so treat
+    cached documents as read-only. None results are cached too, but only
+    for negative_ttl. serve_stale=False is for values that don't come from
+    Mongo, where the breaker says nothing about whether they can be fetched.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int = CACHE_MAX_SIZE,
+                 negative_ttl: float = CACHE_NEGATIVE_TTL, serve_stale: bool = True):
+        self.name = name
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self.negative_ttl = min(negative_ttl, ttl)
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if not CACHE_ENABLED:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if not self.serve_stale:
+            entry = None
+        if entry is not None and mongo_breaker.is_open:
+            self.stale += 1
+            return entry[1]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter must not cancel the shared load
+            return await asyncio.shield(pending)
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if entry is not None and isinstance(e, STORAGE_ERRORS):
+                # Degraded: an expired document beats no document
+                self.stale += 1
+                future.set_result(entry[1])
+                return entry[1]
+            future.set_exception(e)
+            future.exception()  # waiters get it; don't log it as unretrieved
+            raise
+
+        # An invalidation during the load detaches the future; its value is stale
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value the caller just wrote, saving the next read
+        """
+        self._inflight.pop(key, None)
+        self._store(key, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+class CachedCollection:
+    """
+    find_one through a ReadThroughCache keyed by the exact filter and
+    projection. Write paths call invalidate()/prime() with the same filter
+    the readers use.
+    """
+
+    def __init__(self, collection, ttl: float, max_size: int = CACHE_MAX_SIZE, name: Optional[str] = None):
+        self.collection = collection
+        name = name or collection.name
+        ttl = float(os.getenv(f"CACHE_TTL_{name.upper()}", ttl))
+        self.cache = ReadThroughCache(name, ttl, max_size)
+
+    @staticmethod
+    def _key(filter: dict, projection: Optional[dict]) -> tuple:
+        return repr(sorted(filter.items())), repr(projection)
+
+    async def find_one(self, filter: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.cache.get(
+            self._key(filter, projection),
+            lambda: mongo_breaker.call(lambda: self.collection.find_one(filter, projection))
+        )
+
+    def prime(self, filter: dict, document: Optional[dict], projection: Optional[dict] = None) -> None:
+        self.cache.prime(self._key(filter, projection), document)
+
+    def invalidate(self, filter: dict, projection: Optional[dict] = None) -> None:
+        self.cache.invalidate(self._key(filter, projection))
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+def cached_collection(collection, ttl: float, max_size: int = CACHE_MAX_SIZE, name: Optional[str] = None) -> CachedCollection:
+    """
+    Opt a collection into read-through caching. The TTL can be overridden
+    per collection with CACHE_TTL_<NAME>, e.g. CACHE_TTL_GROUPS=60
+    """
+    return CachedCollection(collection, ttl, max_size, name)
@@ -10,12 +10,29 @@ import subprocess
 import tempfile
 import shutil
 from datetime import datetime
+from pymongo import IndexModel
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from .db import db, send_log, send_error_to_support
+from .db import db, get_collection, send_log, send_error_to_support
 
 # Collection for storing clone bot data
-clone_bots_collection = db["clone_bots"]
+clone_bots_collection = get_collection("clone_bots", write_concern="majority")
+
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "clone_bots": [
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("created_at", -1)]),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "clone_bots": [
+        {"filter": {"user_id": 0}},
+        {"filter": {}, "sort": [("created_at", -1)]},
+    ]
+}
 
 class CloneBotManager:
     def __init__(self):
@@ -124,6 +141,9 @@ from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
 )
+from plugins.outbound import OutboundScheduler
+from plugins.lazy import LazyPlugin, load_manifest
+from plugins.db import ensure_indexes, find_collection_scans, flush_notifications
 
 # ----------- Logging -----------
 logging.basicConfig(
@@ -157,6 +177,8 @@ async def send_clone_error_to_support(text: str):
         pass
 
 PLUGINS: Dict[str, Dict[str, Any]] = {{}}
+# Loaded plugin modules, for their shutdown hooks
+MODULES: Dict[str, Any] = {{}}
 
 # ----------- Static Text Loaders -----------
 def load_text_file(filename: str) -> str:
@@ -170,17 +192,46 @@ ABOUT_TEXT = load_text_file("about.txt")
 HELP_HEADER = load_text_file("help.txt")
 WELCOME_TEXT = load_text_file("welcome.txt")
 
+# ----------- Index Bootstrap -----------
+async def bootstrap_indexes(name: str, module) -> None:
+    """Reconcile a plugin's declared INDEXES and explain its declared QUERIES."""
+    if hasattr(module, "prepare_indexes"):
+        await module.prepare_indexes()
+    for action in await ensure_indexes(getattr(module, "INDEXES", {{}})):
+        logging.info(f"🗂 Plugin {{name}} index: {{action}}")
+    for scan in await find_collection_scans(getattr(module, "QUERIES", {{}})):
+        logging.warning(f"🐢 Plugin {{name}} still scans: {{scan}}")
+
 # ----------- Async Plugin Loader -----------
 async def load_plugins(app: Application) -> None:
     global PLUGINS
     PLUGINS.clear()
+    MODULES.clear()
     plugin_dir = "plugins"
     if not os.path.isdir(plugin_dir):
         return
 
+    async def init_lazy_plugin(name: str, module) -> None:
+        # Lazy plugins skip the boot-time test(); the rest of init runs on first use
+        if hasattr(module, "INDEXES") or hasattr(module, "QUERIES"):
+            await bootstrap_indexes(name, module)
+        if hasattr(module, "startup"):
+            await module.startup(app)
+        MODULES[name] = module
+        if hasattr(module, "get_info"):
+            PLUGINS[name] = module.get_info() or {{}}
+
+    manifest = load_manifest()
+
     for file in os.listdir(plugin_dir):
         if file.endswith(".py") and file != "__init__.py":
             name = file[:-3]
+            if name in manifest:
+                # Imported on first use from the manifest's stub handlers
+                lazy_plugin = LazyPlugin(app, name, manifest[name], package=plugin_dir, on_load=init_lazy_plugin)
+                lazy_plugin.register()
+                PLUGINS[name] = lazy_plugin.get_info()
+                continue
             try:
                 module = importlib.import_module(f"{{plugin_dir}}.{{name}}")
 
@@ -196,6 +247,10 @@ async def load_plugins(app: Application) -> None:
                         )
                         continue
 
+                if hasattr(module, "startup"):
+                    await module.startup(app)
+                MODULES[name] = module
+
                 if hasattr(module, "get_info"):
                     PLUGINS[name] = module.get_info() or {{}}
 
@@ -204,6 +259,16 @@ async def load_plugins(app: Application) -> None:
                     f"*❌ Plugin `{{name}}` load error:*\\n`{{e}}`\\n```{{traceback.format_exc()}}```"
                 )
 
+async def shutdown_plugins(app: Application) -> None:
+    for name, module in MODULES.items():
+        if hasattr(module, "shutdown"):
+            try:
+                await module.shutdown(app)
+            except Exception as e:
+                logging.error(f"❌ Plugin {{name}} shutdown error: {{e}}")
+    # Last, so reports raised by plugin shutdowns still reach the support chat
+    await flush_notifications()
+
 # ----------- UI Markups -----------
 def build_main_menu_markup() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
@@ -283,7 +348,13 @@ def main():
     if not TOKEN:
         raise RuntimeError("❌ BOT_TOKEN is not set.")
 
-    application = ApplicationBuilder().token(TOKEN).concurrent_updates(True).build()
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .rate_limiter(OutboundScheduler())
+        .build()
+    )
 
     # Add error handler
     application.add_error_handler(error_handler)
@@ -302,10 +373,12 @@ def main():
 
     # Set post-init tasks
     application.post_init = post_init
+    # Plugins write out what they still hold in memory
+    application.post_shutdown = shutdown_plugins
 
     print("🚀 Clone Bot is starting...")
     logging.info("🚀 Clone Bot is running.")
-    application.run_polling()
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -469,12 +542,6 @@ async def test() -> None:
     """
     # Test database connection
     await db.command("ping")
-    
-    # Test that collections exist
-    collections = await db.list_collection_names()
-    if "clone_bots" not in collections:
-        # Create the collection if it doesn't exist
-        await clone_bots_collection.create_index("user_id", unique=True)
 
 def get_info() -> dict:
     """
@@ -854,12 +921,6 @@ async def test() -> None:
     """
     # Test database connection
     await db.command("ping")
-    
-    # Test that collections exist
-    collections = await db.list_collection_names()
-    if "clone_bots" not in collections:
-        # Create the collection if it doesn't exist
-        await clone_bots_collection.create_index("user_id", unique=True)
 
 def get_info() -> dict:
     """
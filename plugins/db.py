@@ -1,16 +1,118 @@
 import os
+import logging
+import importlib.util
 import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReadPreference, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError
 from telegram import Bot
+from .breaker import TRANSIENT_ERRORS, is_transient_write_error
+from .metrics import command_metrics, current_handler, note_handler_error
+from .notifier import SupportNotifier, describe_exception, fingerprint_text
+
+# main.py imports this module before it loads .env; the Mongo settings below need it now
+load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
+# "mongo" (default) or "memory" for runs without a database server
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPPORT_CHAT_ID = os.getenv("SUPPORT_CHAT_ID")
 
-client = AsyncIOMotorClient(MONGO_URI)
+# Clone bots run as separate processes against the same cluster, so each
+# gets a smaller pool that releases idle connections by default
+CLONE_OWNER_ID = os.getenv("CLONE_OWNER_ID")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10" if CLONE_OWNER_ID else "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000" if CLONE_OWNER_ID else "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+# Backstop for unguarded calls (index builds, explain, init); calls through
+# the circuit breaker are cut off by the driver at MONGO_OP_TIMEOUT instead
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+# Wire compression; defaults to zstd when the zstandard package is installed
+MONGO_COMPRESSORS = os.getenv(
+    "MONGO_COMPRESSORS",
+    "zstd,zlib" if importlib.util.find_spec("zstandard") else "zlib"
+)
+# Per-collection read preference, e.g. "stats=secondaryPreferred,errors=nearest"
+MONGO_READ_PREFERENCES = os.getenv("MONGO_READ_PREFERENCES", "")
+
+def _client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS or None,
+        "appname": f"lunabot-clone-{CLONE_OWNER_ID}" if CLONE_OWNER_ID else "lunabot",
+        # Per-command timings, slow-query log and round trips per handler call
+        "event_listeners": [command_metrics],
+    }
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+if STORAGE_BACKEND == "memory":
+    from .storage import MemoryClient
+    client = MemoryClient()
+else:
+    client = AsyncIOMotorClient(MONGO_URI, **_client_options())
 db = client["telegram_bot"]
+
+# Named write concerns plugins pick per collection handle
+WRITE_CONCERNS = {
+    "default": None,
+    # Analytics and counters: acknowledged by the primary, no journal wait
+    "fast": WriteConcern(w=1, j=False),
+    # Data that must survive a failover, e.g. clone bot tokens
+    "majority": WriteConcern(w="majority", j=True, wtimeout=10000),
+}
+
+READ_PREFERENCE_MODES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+READ_PREFERENCES = {
+    name.strip(): READ_PREFERENCE_MODES[mode.strip()]
+    for name, mode in (item.split("=", 1) for item in MONGO_READ_PREFERENCES.split(",") if "=" in item)
+}
+
+def get_collection(name: str, write_concern: str = "default"):
+    """
+    Collection handle with a named write concern ("default", "fast" or
+    "majority") and the read preference configured for that collection
+    """
+    options = {}
+    if WRITE_CONCERNS[write_concern] is not None:
+        options["write_concern"] = WRITE_CONCERNS[write_concern]
+    if name in READ_PREFERENCES:
+        options["read_preference"] = READ_PREFERENCES[name]
+    return db.get_collection(name, **options)
+
 bot = Bot(token=BOT_TOKEN)
 
+# Every support-chat message goes through one background queue
+notifier = SupportNotifier(bot, SUPPORT_CHAT_ID)
+
+# Maintained sequence counters, one document per name
+counters_collection = get_collection("counters")
+
+# Hourly error counters per fingerprint, expired by a TTL index on "hour"
+errors_collection = get_collection("errors", write_concern="fast")
+
+logger = logging.getLogger(__name__)
+
 async def init():
     try:
         await db.command("ping")
@@ -24,22 +126,230 @@ async def init():
 async def test():
     await db.command("ping")  # Used by plugin loader to validate DB connection
 
+async def next_sequence(name: str) -> int:
+    """Atomically increment and return the named counter."""
+    counter = await counters_collection.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def reserve_sequence(name: str, count: int) -> int:
+    """Atomically reserve `count` consecutive values of the named counter; returns the first."""
+    counter = await counters_collection.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"] - count + 1
+
+async def release_sequence(name: str, last: int, count: int) -> bool:
+    """
+    Give back the top `count` values of the named counter, provided `last`
+    is still the latest value reserved; returns whether it was given back
+    """
+    result = await counters_collection.update_one({"_id": name, "seq": last}, {"$inc": {"seq": -count}})
+    return result.modified_count == 1
+
+async def seed_sequence(name: str, value: int) -> None:
+    """Initialise the named counter unless it already exists."""
+    await counters_collection.update_one(
+        {"_id": name},
+        {"$setOnInsert": {"seq": value}},
+        upsert=True
+    )
+
+# Options that make two indexes with the same name differ
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def _normalize_index(spec: dict) -> dict:
+    key = spec["key"]
+    if hasattr(key, "items"):
+        key = key.items()
+    options = {}
+    for option in INDEX_OPTIONS:
+        value = spec.get(option)
+        if option in ("unique", "sparse"):
+            value = bool(value)
+        elif isinstance(value, dict):
+            value = dict(value)
+        options[option] = value
+    key = [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+           for field, direction in key]
+    return {"key": key, **options}
+
+async def ensure_indexes(indexes: Dict[str, List[IndexModel]]) -> List[str]:
+    """
+    Reconcile declared indexes against Mongo; safe to run on every boot.
+
+    Missing indexes are created, a changed TTL is migrated in place with
+    collMod and any other mismatch is dropped and rebuilt. Returns one line
+    per action taken.
+    """
+    actions = []
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+            to_create = []
+            for model in models:
+                spec = model.document
+                name = spec["name"]
+                if name not in existing:
+                    to_create.append(model)
+                    continue
+
+                wanted = _normalize_index(spec)
+                current = _normalize_index(existing[name])
+                if wanted == current:
+                    continue
+
+                changed = {k for k in wanted if wanted[k] != current[k]}
+                if changed == {"expireAfterSeconds"} and current["expireAfterSeconds"] is not None \
+                        and wanted["expireAfterSeconds"] is not None:
+                    await db.command(
+                        "collMod", collection_name,
+                        index={"name": name, "expireAfterSeconds": wanted["expireAfterSeconds"]}
+                    )
+                    actions.append(f"{collection_name}.{name}: TTL set to {wanted['expireAfterSeconds']}s")
+                    continue
+
+                await collection.drop_index(name)
+                to_create.append(model)
+                actions.append(f"{collection_name}.{name}: rebuilt ({', '.join(sorted(changed))} changed)")
+
+            if to_create:
+                created = await collection.create_indexes(to_create)
+                actions.extend(f"{collection_name}.{name}: created" for name in created)
+        except Exception as e:
+            actions.append(f"{collection_name}: index sync failed: {e}")
+    return actions
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for child in ("inputStage", "outerStage", "innerStage"):
+        if child in plan:
+            yield from _plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def find_collection_scans(queries: Dict[str, List[dict]]) -> List[str]:
+    """
+    Explain each declared query shape and report the ones still planned as COLLSCAN.
+    A query shape is {"filter": {...}, "sort": [(field, direction), ...]}.
+    """
+    scans = []
+    for collection_name, shapes in queries.items():
+        for shape in shapes:
+            try:
+                cursor = db[collection_name].find(shape.get("filter", {}))
+                if shape.get("sort"):
+                    cursor = cursor.sort(shape["sort"])
+                plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+                # Newer servers wrap the classic plan in queryPlan
+                plan = plan.get("queryPlan", plan)
+                if "COLLSCAN" in _plan_stages(plan):
+                    scans.append(f"{collection_name}: COLLSCAN for {shape}")
+            except Exception as e:
+                scans.append(f"{collection_name}: explain failed for {shape}: {e}")
+    return scans
+
 async def send_error_to_support(text: str):
-    try:
-        await bot.send_message(
-            chat_id=SUPPORT_CHAT_ID,
-            text=text[:4000],
-            parse_mode="MarkdownV2"
+    """
+    Queue an error report for the support chat. Called from an except block,
+    repeats of the same failure are grouped by exception type and origin.
+    """
+    note_handler_error()
+    info = describe_exception()
+    if info is None:
+        stats = current_handler.get()
+        info = {
+            "fingerprint": fingerprint_text(text),
+            "exc_type": None,
+            "plugin": stats.plugin if stats else None,
+            "handler": stats.handler if stats else None,
+            "frame": None
+        }
+    record_error(info, text)
+    notifier.error(text, info["fingerprint"])
+
+# Pending error counters keyed by "<fingerprint>:<YYYYMMDDHH>"
+_error_buffer: Dict[str, dict] = {}
+
+def record_error(info: dict, message: str, when: Optional[datetime] = None) -> None:
+    """
+    Count one occurrence of a fingerprinted error in the current hour's bucket
+    """
+    now = when or datetime.utcnow()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    key = f"{info['fingerprint']}:{hour:%Y%m%d%H}"
+    entry = _error_buffer.get(key)
+    if entry is None:
+        entry = _error_buffer[key] = {**info, "hour": hour, "message": message[:300], "count": 0, "first_seen": now}
+    entry["count"] += 1
+    entry["last_seen"] = now
+
+def _requeue_error_records(pending: Dict[str, dict]) -> None:
+    """
+    Fold counters whose write failed back into the buffer
+    """
+    for key, failed in pending.items():
+        entry = _error_buffer.get(key)
+        if entry is None:
+            _error_buffer[key] = failed
+            continue
+        entry["count"] += failed["count"]
+        entry["first_seen"] = min(entry["first_seen"], failed["first_seen"])
+        entry["last_seen"] = max(entry["last_seen"], failed["last_seen"])
+
+async def flush_error_records() -> None:
+    """
+    Write buffered error counters in one unordered bulk upsert
+    """
+    if not _error_buffer:
+        return
+    pending = dict(_error_buffer)
+    _error_buffer.clear()
+    ops = [
+        UpdateOne(
+            {"_id": key},
+            {
+                "$setOnInsert": {
+                    field: entry[field]
+                    for field in ("fingerprint", "hour", "plugin", "handler", "exc_type", "frame", "message")
+                },
+                "$inc": {"count": entry["count"]},
+                "$min": {"first_seen": entry["first_seen"]},
+                "$max": {"last_seen": entry["last_seen"]}
+            },
+            upsert=True
         )
-    except Exception:
-        pass
+        for key, entry in pending.items()
+    ]
+    # Failures are not reported to support: a failing write here would only feed itself
+    try:
+        await errors_collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # The rest of an unordered batch was applied; keep what may succeed later
+        keys = list(pending)
+        retry = [error["index"] for error in e.details["writeErrors"] if is_transient_write_error(error)]
+        _requeue_error_records({keys[index]: pending[keys[index]] for index in retry})
+        logger.error(f"Failed to write {len(e.details['writeErrors'])} error records, kept {len(retry)}: {e}")
+    except TRANSIENT_ERRORS as e:
+        # Mongo trouble is when these counters matter most; try again next flush
+        _requeue_error_records(pending)
+        logger.error(f"Failed to write {len(ops)} error records, kept for the next flush: {e}")
+    except Exception as e:
+        logger.error(f"Failed to write {len(ops)} error records: {e}")
 
 async def send_log(text: str):
-    try:
-        await bot.send_message(
-            chat_id=SUPPORT_CHAT_ID,
-            text=text[:4000],
-            parse_mode="MarkdownV2"
-        )
-    except Exception:
-        pass
+    notifier.log(text)
+
+async def flush_notifications():
+    """
+    Send queued support-chat messages immediately; called on shutdown
+    """
+    await notifier.flush()
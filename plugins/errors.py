@@ -0,0 +1,127 @@
+"""
+Errors Plugin for LunaBot
+Persists the fingerprinted error counters collected by db.send_error_to_support
+and lets the owner see which plugins fail most with /errors
+"""
+
+import os
+import traceback
+from datetime import datetime, timedelta
+from pymongo import IndexModel
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+from .db import db, errors_collection, flush_error_records, send_error_to_support
+
+ERRORS_FLUSH_INTERVAL = float(os.getenv("ERRORS_FLUSH_INTERVAL", "30"))
+ERRORS_TTL_DAYS = int(os.getenv("ERRORS_TTL_DAYS", "7"))
+ERRORS_TOP = 10
+
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "errors": [
+        IndexModel([("hour", 1)], expireAfterSeconds=ERRORS_TTL_DAYS * 86400)
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "errors": [{"filter": {"hour": {"$gte": datetime(2000, 1, 1)}}}]
+}
+
+async def top_errors(hours: int, limit: int = ERRORS_TOP) -> list:
+    """
+    Fingerprints with the most occurrences in the last `hours` hours
+    """
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    pipeline = [
+        {"$match": {"hour": {"$gte": since}}},
+        {"$group": {
+            "_id": "$fingerprint",
+            "count": {"$sum": "$count"},
+            "first_seen": {"$min": "$first_seen"},
+            "last_seen": {"$max": "$last_seen"},
+            "plugin": {"$first": "$plugin"},
+            "handler": {"$first": "$handler"},
+            "exc_type": {"$first": "$exc_type"},
+            "frame": {"$first": "$frame"}
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    return await errors_collection.aggregate(pipeline).to_list(length=limit)
+
+async def errors_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Show the top failing fingerprints (owner only): /errors [hours]
+    """
+    try:
+        OWNER_ID = [int(x) for x in os.getenv("OWNER_ID", "").split(",") if x.strip()]
+        if update.effective_user.id not in OWNER_ID:
+            await update.message.reply_text("❌ You don't have permission to use this command.")
+            return
+
+        hours = 1
+        if context.args and context.args[0].isdigit():
+            hours = max(1, min(int(context.args[0]), ERRORS_TTL_DAYS * 24))
+
+        await flush_error_records()
+        rows = await top_errors(hours)
+        if not rows:
+            await update.message.reply_text(f"✅ No errors recorded in the last {hours}h.")
+            return
+
+        lines = []
+        for row in rows:
+            where = f"{row.get('plugin') or '?'}.{row.get('handler') or '?'}"
+            lines.append(
+                f"{row['_id']}  {row['count']}× ({row['count'] / hours:.1f}/h)  {where}\n"
+                f"  {row.get('exc_type') or 'report'} @ {row.get('frame') or '-'}\n"
+                f"  {row['first_seen']:%m-%d %H:%M} → {row['last_seen']:%m-%d %H:%M} UTC"
+            )
+        table = "\n".join(lines).replace("\\", "\\\\").replace("`", "'")
+        await update.message.reply_text(
+            f"🧯 *Top errors, last {hours}h*\n```\n{table}\n```",
+            parse_mode="MarkdownV2"
+        )
+    except Exception as e:
+        await send_error_to_support(f"*❌ Errors Command Error:*\n`{str(e)}`\n```{traceback.format_exc()}```")
+
+async def flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await flush_error_records()
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(CommandHandler("errors", errors_command))
+    app.job_queue.run_repeating(
+        flush_job,
+        interval=ERRORS_FLUSH_INTERVAL,
+        first=ERRORS_FLUSH_INTERVAL,
+        name="errors_flush"
+    )
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+async def shutdown(app: Application) -> None:
+    """
+    Write buffered error counters before the process exits
+    """
+    await flush_error_records()
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Errors",
+        "description": "Fingerprinted error counters for triage",
+        "version": "1.0.0",
+        "commands": [
+            "/errors [hours] - Top failing handlers (admin only)"
+        ]
+    }
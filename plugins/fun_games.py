@@ -5,17 +5,203 @@ Provides entertaining games and interactive features
 
 import os
 import random
+import logging
 import traceback
 import asyncio
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from pymongo import IndexModel
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from .db import db, send_log, send_error_to_support
+from .cache import cached_collection
+from .breaker import STORAGE_ERRORS, mongo_breaker
+from .journal import journaled_write
+from .callbacks import sign_callback, verify_hidden, encode_int, decode_int
+from .question_bank import DIFFICULTIES, category_key, draw_question, list_categories
+from .leaderboard import game_points, record_win
 
 # Collections
 games_collection = db["games"]
 trivia_collection = db["trivia"]
 
+# Active games older than GAME_TIMEOUT_MINUTES are expired by the reaper,
+# GAME_REAPER_BATCH at a time; finished games are deleted by a TTL index
+# GAME_HISTORY_DAYS after their end_time
+GAME_TIMEOUT_MINUTES = float(os.getenv("GAME_TIMEOUT_MINUTES", "30"))
+GAME_REAPER_INTERVAL = float(os.getenv("GAME_REAPER_INTERVAL", "60"))
+GAME_REAPER_BATCH = int(os.getenv("GAME_REAPER_BATCH", "200"))
+GAME_HISTORY_DAYS = int(os.getenv("GAME_HISTORY_DAYS", "7"))
+
+logger = logging.getLogger(__name__)
+
+# Indexes reconciled by the plugin loader at boot. Only active games are ever
+# looked up by chat, so those indexes stay partial and small.
+INDEXES = {
+    "games": [
+        IndexModel([("chat_id", 1), ("user_id", 1)], name="active_by_user",
+                   partialFilterExpression={"status": "active"}),
+        IndexModel([("chat_id", 1), ("message_id", 1)], name="active_by_message",
+                   partialFilterExpression={"status": "active"}),
+        IndexModel([("status", 1), ("start_time", 1)]),
+        # Active games have no end_time, so only finished ones expire
+        IndexModel([("end_time", 1)], expireAfterSeconds=GAME_HISTORY_DAYS * 86400),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "games": [
+        {"filter": {"chat_id": 0, "user_id": 0, "status": "active"}},
+        {"filter": {"chat_id": 0, "message_id": 0, "status": "active"}},
+        {"filter": {"status": "active", "game_type": {"$in": ["riddle", "word"]}},
+         "sort": [("start_time", 1)]},
+        {"filter": {"status": "active", "start_time": {"$lt": datetime(2000, 1, 1)}},
+         "sort": [("start_time", 1)]},
+    ]
+}
+
+# In-memory registry of active riddle/word games keyed by (chat_id, user_id).
+# Mongo stays the durable record; this only spares handle_game_message a
+# round trip for every ordinary chat message.
+TEXT_GAME_TYPES = ("riddle", "word")
+active_games = {}
+
+def _register_game(game_data: dict) -> None:
+    active_games[(game_data["chat_id"], game_data["user_id"])] = game_data
+
+def _forget_game(game: dict) -> None:
+    key = (game["chat_id"], game["user_id"])
+    current = active_games.get(key)
+    if current is not None and current.get("_id") == game.get("_id"):
+        del active_games[key]
+
+# Trivia buttons carry "tv:<owner>:<round>:<option>" signed (callbacks.py)
+# together with a hidden right/wrong tag, so the client can't tell which
+# button is correct but the server can, from the message's own buttons.
+# <round> is random per message, so signatures never repeat across games.
+# Buttons sent before the question bank index TRIVIA_QUESTIONS with no tag.
+# Presses already handled are remembered per message to ignore double taps
+# before the buttons disappear.
+TRIVIA_CALLBACK = "tv"
+TRIVIA_CANCEL = "c"
+TRIVIA_RIGHT = "1"
+TRIVIA_WRONG = "0"
+TRIVIA_TAGS = (TRIVIA_RIGHT, TRIVIA_WRONG)
+RESOLVED_TRIVIA_MAX = 10000
+resolved_trivia = OrderedDict()
+
+def _claim_trivia(chat_id: int, message_id: int) -> bool:
+    key = (chat_id, message_id)
+    if key in resolved_trivia:
+        return False
+    resolved_trivia[key] = True
+    while len(resolved_trivia) > RESOLVED_TRIVIA_MAX:
+        resolved_trivia.popitem(last=False)
+    return True
+
+def _release_trivia(chat_id: int, message_id: int) -> None:
+    resolved_trivia.pop((chat_id, message_id), None)
+
+def _read_trivia_buttons(reply_markup) -> tuple:
+    """
+    Option labels and the index of the correct one, from a trivia message's
+    signed buttons. Options are labelled "A. <option>"; the last row is Cancel.
+    """
+    options, correct = [], None
+    for row in reply_markup.inline_keyboard[:-1]:
+        button = row[0]
+        signed = verify_hidden(button.callback_data, TRIVIA_CALLBACK, TRIVIA_TAGS)
+        if signed is not None and signed[1] == TRIVIA_RIGHT:
+            correct = len(options)
+        options.append(button.text.split(". ", 1)[-1])
+    return options, correct
+
+# Active games by the message carrying their buttons, for game_callback.
+# Primed on insert and invalidated whenever a game leaves the active state.
+games_cache = cached_collection(games_collection, ttl=600)
+
+def _message_filter(game: dict) -> dict:
+    return {"chat_id": game["chat_id"], "message_id": game["message_id"], "status": "active"}
+
+async def load_active_games() -> int:
+    """
+    Rebuild the active game registry from Mongo so in-flight games survive a restart
+    """
+    active_games.clear()
+    cursor = games_collection.find(
+        {"status": "active", "game_type": {"$in": list(TEXT_GAME_TYPES)}}
+    ).sort("start_time", 1)
+    async for game in cursor:
+        # Newest game per (chat, user) wins, matching what the user last saw
+        _register_game(game)
+    return len(active_games)
+
+def _times_up_text(game: dict) -> str:
+    text = "⏰ **Time's up!**"
+    if game["game_type"] == "riddle":
+        text += f"\n\n**Answer:** {game['riddle_data']['answer']}"
+    elif game["game_type"] == "word":
+        text += f"\n\n**Word:** {game['word_data']['word']}"
+    elif game["game_type"] == "trivia":
+        question = game["question_data"]
+        text += f"\n\n**Answer:** {question['options'][question['correct']]}"
+    return text
+
+async def reap_expired_games(bot) -> int:
+    """
+    Expire one batch of active games that outlived GAME_TIMEOUT_MINUTES,
+    oldest first, and edit their messages to say so
+    """
+    now = datetime.utcnow()
+    cursor = games_collection.find(
+        {"status": "active", "start_time": {"$lt": now - timedelta(minutes=GAME_TIMEOUT_MINUTES)}}
+    ).sort("start_time", 1).limit(GAME_REAPER_BATCH)
+    games = await mongo_breaker.call(lambda: cursor.to_list(length=GAME_REAPER_BATCH))
+    if not games:
+        return 0
+
+    # The status guard keeps a game answered since the find from being
+    # expired. Not journaled: if Mongo is down the next run retries.
+    ids = [game["_id"] for game in games]
+    await mongo_breaker.call(lambda: games_collection.update_many(
+        {"_id": {"$in": ids}, "status": "active"},
+        {"$set": {"status": "expired", "end_time": now}}
+    ))
+    # Only the games this run expired (stamped with its end_time) get edited
+    expired = await mongo_breaker.call(lambda: games_collection.find(
+        {"_id": {"$in": ids}, "status": "expired", "end_time": now}, {"_id": 1}
+    ).to_list(length=len(ids)))
+    expired_ids = {game["_id"] for game in expired}
+    games = [game for game in games if game["_id"] in expired_ids]
+    for game in games:
+        _forget_game(game)
+        games_cache.invalidate(_message_filter(game))
+
+    for game in games:
+        try:
+            await bot.edit_message_text(
+                _times_up_text(game), chat_id=game["chat_id"], message_id=game["message_id"]
+            )
+        except TelegramError as e:
+            # Deleted message or chat the bot left; the game is expired regardless
+            logger.debug(f"Could not mark game {game['_id']} as timed out: {e}")
+    return len(games)
+
+async def reaper_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        reaped = await reap_expired_games(context.bot)
+        if reaped:
+            logger.info(f"Expired {reaped} abandoned games")
+    except STORAGE_ERRORS:
+        # Mongo is unavailable; the next run catches up
+        pass
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Game Reaper Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
 # Game data
 TRIVIA_QUESTIONS = [
     {
@@ -141,14 +327,47 @@ async def start_trivia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     Start a trivia game
     """
     try:
-        question_data = random.choice(TRIVIA_QUESTIONS)
+        # /trivia [category | difficulty]
+        choice = " ".join(context.args) if context.args else None
+        difficulty = choice.lower() if choice and choice.lower() in DIFFICULTIES else None
+        category = choice if choice and not difficulty else None
+        
+        question = await draw_question(
+            "trivia", update.effective_chat.id, category=category, difficulty=difficulty
+        )
+        if question:
+            question_id = question["gseq"]
+            question_data = question["data"]
+        else:
+            # Empty bank (or Mongo unavailable): fall back to the built-in questions
+            candidates = [
+                q for q in TRIVIA_QUESTIONS
+                if not category or category_key(q["category"]) == category_key(category)
+            ]
+            if not candidates:
+                categories = [name for name, _ in await list_categories("trivia")]
+                categories += sorted({category_key(q["category"]) for q in TRIVIA_QUESTIONS} - set(categories))
+                await update.message.reply_text(
+                    f"❌ No trivia questions in '{category}'.\n"
+                    f"**Categories:** {', '.join(categories[:30])}"
+                )
+                return
+            question_id = None
+            question_data = random.choice(candidates)
+        
+        owner = encode_int(update.effective_user.id)
+        round_ref = encode_int(random.getrandbits(32))
+        correct = question_data["correct"]
         
         # Create keyboard with options
         keyboard = []
         for i, option in enumerate(question_data["options"]):
-            keyboard.append([InlineKeyboardButton(f"{chr(65+i)}. {option}", callback_data=f"trivia_{i}")])
+            tag = TRIVIA_RIGHT if i == correct else TRIVIA_WRONG
+            callback_data = sign_callback(TRIVIA_CALLBACK, owner, round_ref, i, hidden=tag)
+            keyboard.append([InlineKeyboardButton(f"{chr(65+i)}. {option}", callback_data=callback_data)])
         
-        keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="trivia_cancel")])
+        cancel_data = sign_callback(TRIVIA_CALLBACK, owner, round_ref, TRIVIA_CANCEL, hidden=TRIVIA_WRONG)
+        keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data=cancel_data)])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -164,12 +383,14 @@ async def start_trivia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "message_id": message.message_id,
             "user_id": update.effective_user.id,
             "game_type": "trivia",
+            "question_id": question_id,
             "question_data": question_data,
             "start_time": datetime.utcnow(),
             "status": "active"
         }
         
-        await games_collection.insert_one(game_data)
+        # Presses never read this back; it is the record for history and the reaper
+        await journaled_write(games_collection, "insert_one", game_data)
         
     except Exception as e:
         await send_error_to_support(
@@ -181,7 +402,8 @@ async def start_riddle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     Start a riddle game
     """
     try:
-        riddle_data = random.choice(RIDDLES)
+        question = await draw_question("riddle", update.effective_chat.id)
+        riddle_data = question["data"] if question else random.choice(RIDDLES)
         
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("💡 Get Hint", callback_data="riddle_hint")],
@@ -206,7 +428,9 @@ async def start_riddle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "hint_used": False
         }
         
-        await games_collection.insert_one(game_data)
+        await journaled_write(games_collection, "insert_one", game_data)
+        games_cache.prime(_message_filter(game_data), game_data)
+        _register_game(game_data)
         
     except Exception as e:
         await send_error_to_support(
@@ -218,7 +442,8 @@ async def start_word_game(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     Start a word guessing game
     """
     try:
-        word_data = random.choice(WORD_GAMES)
+        question = await draw_question("word", update.effective_chat.id)
+        word_data = question["data"] if question else random.choice(WORD_GAMES)
         word = word_data["word"]
         
         # Create scrambled word
@@ -251,7 +476,9 @@ async def start_word_game(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "hint_used": False
         }
         
-        await games_collection.insert_one(game_data)
+        await journaled_write(games_collection, "insert_one", game_data)
+        games_cache.prime(_message_filter(game_data), game_data)
+        _register_game(game_data)
         
     except Exception as e:
         await send_error_to_support(
@@ -371,11 +598,7 @@ async def handle_game_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         message_text = update.message.text.lower().strip()
         
         # Check for active games
-        active_game = await games_collection.find_one({
-            "chat_id": chat_id,
-            "user_id": user_id,
-            "status": "active"
-        })
+        active_game = active_games.get((chat_id, user_id))
         
         if not active_game:
             return
@@ -384,14 +607,21 @@ async def handle_game_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             correct_answer = active_game["riddle_data"]["answer"].lower()
             if message_text == correct_answer:
                 # Correct answer!
-                await games_collection.update_one(
+                _forget_game(active_game)
+                games_cache.invalidate(_message_filter(active_game))
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": active_game["_id"]},
                     {"$set": {"status": "completed", "end_time": datetime.utcnow()}}
                 )
                 
                 time_taken = datetime.utcnow() - active_game["start_time"]
+                points = record_win(
+                    chat_id, user_id, update.effective_user.first_name, "riddle",
+                    hint_used=active_game.get("hint_used", False)
+                )
                 
-                success_text = f"🎉 **Correct!**\n\n"
+                success_text = f"🎉 **Correct!** (+{points})\n\n"
                 success_text += f"**Answer:** {active_game['riddle_data']['answer']}\n"
                 success_text += f"**Time:** {time_taken.seconds} seconds"
                 if active_game.get("hint_used"):
@@ -403,14 +633,21 @@ async def handle_game_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             correct_word = active_game["word_data"]["word"].lower()
             if message_text == correct_word:
                 # Correct answer!
-                await games_collection.update_one(
+                _forget_game(active_game)
+                games_cache.invalidate(_message_filter(active_game))
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": active_game["_id"]},
                     {"$set": {"status": "completed", "end_time": datetime.utcnow()}}
                 )
                 
                 time_taken = datetime.utcnow() - active_game["start_time"]
+                points = record_win(
+                    chat_id, user_id, update.effective_user.first_name, "word",
+                    hint_used=active_game.get("hint_used", False)
+                )
                 
-                success_text = f"🎉 **Correct!**\n\n"
+                success_text = f"🎉 **Correct!** (+{points})\n\n"
                 success_text += f"**Word:** {active_game['word_data']['word']}\n"
                 success_text += f"**Time:** {time_taken.seconds} seconds"
                 if active_game.get("hint_used"):
@@ -423,6 +660,70 @@ async def handle_game_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"*❌ Handle Game Message Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
         )
 
+async def trivia_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Resolve a signed trivia button press without reading the game back
+    """
+    try:
+        query = update.callback_query
+        signed = verify_hidden(query.data, TRIVIA_CALLBACK, TRIVIA_TAGS)
+        fields = signed[0] if signed is not None else None
+        if fields is None or len(fields) != 3:
+            await query.answer("❌ This button is no longer valid.", show_alert=True)
+            return
+            
+        owner, choice = decode_int(fields[0]), fields[2]
+        if query.from_user.id != owner:
+            await query.answer("❌ This is not your game!", show_alert=True)
+            return
+            
+        chat_id = query.message.chat.id
+        message_id = query.message.message_id
+        if not _claim_trivia(chat_id, message_id):
+            await query.answer()
+            return
+        await query.answer()
+        
+        won = False
+        if choice == TRIVIA_CANCEL:
+            status = "cancelled"
+            result_text = "❌ Trivia cancelled."
+        else:
+            options, correct_option = _read_trivia_buttons(query.message.reply_markup)
+            selected_option = int(choice)
+            status = "completed"
+            
+            if selected_option == correct_option:
+                won = True
+                points = game_points("trivia")
+                result_text = f"✅ **Correct!** (+{points})\n\n"
+                result_text += f"**Answer:** {options[correct_option]}"
+            else:
+                result_text = f"❌ **Wrong!**\n\n"
+                result_text += f"**Your answer:** {options[selected_option]}\n"
+                result_text += f"**Correct answer:** {options[correct_option]}"
+        
+        try:
+            await query.edit_message_text(result_text)
+        except Exception:
+            # The player never saw a result, so let the next press resolve it
+            _release_trivia(chat_id, message_id)
+            raise
+        
+        # The player sees the result now; the win and the game record follow
+        if won:
+            record_win(chat_id, owner, query.from_user.first_name, "trivia", points=points)
+        context.application.create_task(journaled_write(
+            games_collection, "update_one",
+            {"chat_id": chat_id, "message_id": message_id, "status": "active"},
+            {"$set": {"status": status, "end_time": datetime.utcnow()}}
+        ))
+        
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Trivia Callback Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
 async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle game button callbacks
@@ -436,7 +737,7 @@ async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         user_id = query.from_user.id
         
         # Find the game
-        game = await games_collection.find_one({
+        game = await games_cache.find_one({
             "chat_id": chat_id,
             "message_id": message_id,
             "status": "active"
@@ -450,11 +751,14 @@ async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             await query.answer("❌ This is not your game!", show_alert=True)
             return
             
+        # Unsigned trivia_<n> buttons are from messages sent before signed callbacks
         if query.data.startswith("trivia_"):
             if query.data == "trivia_cancel":
-                await games_collection.update_one(
+                games_cache.invalidate(_message_filter(game))
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": game["_id"]},
-                    {"$set": {"status": "cancelled"}}
+                    {"$set": {"status": "cancelled", "end_time": datetime.utcnow()}}
                 )
                 await query.edit_message_text("❌ Trivia cancelled.")
                 return
@@ -462,13 +766,16 @@ async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             selected_option = int(query.data.split("_")[1])
             correct_option = game["question_data"]["correct"]
             
-            await games_collection.update_one(
+            games_cache.invalidate(_message_filter(game))
+            await journaled_write(
+                games_collection, "update_one",
                 {"_id": game["_id"]},
                 {"$set": {"status": "completed", "end_time": datetime.utcnow()}}
             )
             
             if selected_option == correct_option:
-                result_text = f"✅ **Correct!**\n\n"
+                points = record_win(chat_id, user_id, query.from_user.first_name, "trivia")
+                result_text = f"✅ **Correct!** (+{points})\n\n"
                 result_text += f"**Answer:** {game['question_data']['options'][correct_option]}"
             else:
                 result_text = f"❌ **Wrong!**\n\n"
@@ -479,18 +786,25 @@ async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             
         elif query.data.startswith("riddle_"):
             if query.data == "riddle_hint":
-                await games_collection.update_one(
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": game["_id"]},
                     {"$set": {"hint_used": True}}
                 )
+                registered = active_games.get((chat_id, user_id))
+                if registered is not None and registered.get("_id") == game["_id"]:
+                    registered["hint_used"] = True
                 
                 hint_text = f"💡 **Hint:** {game['riddle_data']['hint']}"
                 await query.answer(hint_text, show_alert=True)
                 
             elif query.data == "riddle_giveup":
-                await games_collection.update_one(
+                _forget_game(game)
+                games_cache.invalidate(_message_filter(game))
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": game["_id"]},
-                    {"$set": {"status": "given_up"}}
+                    {"$set": {"status": "given_up", "end_time": datetime.utcnow()}}
                 )
                 
                 giveup_text = f"🤔 **Answer:** {game['riddle_data']['answer']}\n\n"
@@ -499,18 +813,25 @@ async def game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 
         elif query.data.startswith("word_"):
             if query.data == "word_hint":
-                await games_collection.update_one(
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": game["_id"]},
                     {"$set": {"hint_used": True}}
                 )
+                registered = active_games.get((chat_id, user_id))
+                if registered is not None and registered.get("_id") == game["_id"]:
+                    registered["hint_used"] = True
                 
                 hint_text = f"💡 **Hint:** {game['word_data']['hint']}"
                 await query.answer(hint_text, show_alert=True)
                 
             elif query.data == "word_giveup":
-                await games_collection.update_one(
+                _forget_game(game)
+                games_cache.invalidate(_message_filter(game))
+                await journaled_write(
+                    games_collection, "update_one",
                     {"_id": game["_id"]},
-                    {"$set": {"status": "given_up"}}
+                    {"$set": {"status": "given_up", "end_time": datetime.utcnow()}}
                 )
                 
                 giveup_text = f"🔤 **Answer:** {game['word_data']['word']}\n\n"
@@ -539,7 +860,15 @@ def setup(app: Application) -> None:
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_game_message))
     
     # Callback query handler for game buttons
+    app.add_handler(CallbackQueryHandler(trivia_callback, pattern=f"^{TRIVIA_CALLBACK}:"))
     app.add_handler(CallbackQueryHandler(game_callback, pattern="^(trivia_|riddle_|word_)"))
+    
+    app.job_queue.run_repeating(
+        reaper_job,
+        interval=GAME_REAPER_INTERVAL,
+        first=GAME_REAPER_INTERVAL,
+        name="game_reaper"
+    )
 
 async def test() -> None:
     """
@@ -548,6 +877,12 @@ async def test() -> None:
     # Test database connection
     await db.command("ping")
 
+async def startup(app: Application) -> None:
+    """
+    Called by the loader once the plugin is set up and tested
+    """
+    await load_active_games()
+
 def get_info() -> dict:
     """
     Return plugin information
@@ -557,7 +892,7 @@ def get_info() -> dict:
         "description": "Interactive games and entertainment features",
         "version": "1.0.0",
         "commands": [
-            "/trivia - Start a trivia question",
+            "/trivia [category|difficulty] - Start a trivia question",
             "/riddle - Get a riddle to solve",
             "/wordgame - Play word unscrambling game",
             "/dice [num] [sides] - Roll dice",
@@ -566,6 +901,7 @@ def get_info() -> dict:
         ],
         "features": [
             "Multiple choice trivia questions",
+            "Points on the /leaderboard for every win",
             "Riddles with hints",
             "Word unscrambling games",
             "Dice rolling with custom sides",
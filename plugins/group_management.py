@@ -5,16 +5,73 @@ Provides fun and interactive features for group management
 
 import os
 import random
+import logging
 import traceback
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from .db import db, send_log, send_error_to_support
+from .cache import cached_collection
+from .breaker import STORAGE_ERRORS, mongo_breaker
+from .journal import journaled_write, journaled_bulk_write
+from .admin_cache import is_admin, bot_can_restrict
 
 # Collections
 groups_collection = db["groups"]
 warnings_collection = db["warnings"]
 polls_collection = db["polls"]
+# One live counter per (chat, user); "warnings" keeps the full history
+warn_counters_collection = db["warn_counters"]
+
+# Warnings past the limit trigger WARN_ACTION ("mute", "ban" or "none").
+# A counter decays to zero once WARN_DECAY_DAYS pass without a new warning.
+WARN_LIMIT = int(os.getenv("WARN_LIMIT", "3"))
+WARN_ACTION = os.getenv("WARN_ACTION", "mute").lower()
+WARN_MUTE_HOURS = float(os.getenv("WARN_MUTE_HOURS", "24"))
+WARN_DECAY_DAYS = float(os.getenv("WARN_DECAY_DAYS", "30"))
+WARN_LOG_TTL_DAYS = int(os.getenv("WARN_LOG_TTL_DAYS", "90"))
+
+# Join/leave events keep member_count current; this job corrects the drift
+# (missed updates, bots, kicks) for groups active in the last day
+MEMBER_SYNC_INTERVAL = float(os.getenv("MEMBER_SYNC_INTERVAL", "3600"))
+MEMBER_SYNC_ACTIVE_HOURS = float(os.getenv("MEMBER_SYNC_ACTIVE_HOURS", "24"))
+MEMBER_SYNC_BATCH = int(os.getenv("MEMBER_SYNC_BATCH", "100"))
+
+logger = logging.getLogger(__name__)
+
+# Group documents are read on every /groupstats; the activity tracker keeps
+# rewriting them, so the TTL bounds how stale last_activity can get
+groups_cache = cached_collection(groups_collection, ttl=30)
+
+# Counters that duplicate group documents each hold part of
+GROUP_COUNTERS = ("member_count", "warning_count", "message_count")
+
+# Indexes reconciled by the plugin loader at boot. chat_id is unique so that
+# concurrent upserts for a new group can't create two documents for it.
+INDEXES = {
+    "groups": [IndexModel([("chat_id", 1)], unique=True), IndexModel([("last_activity", 1)])],
+    "warnings": [
+        IndexModel([("chat_id", 1), ("user_id", 1)]),
+        IndexModel([("timestamp", 1)], expireAfterSeconds=WARN_LOG_TTL_DAYS * 86400),
+    ],
+    # Counters are fetched by _id; the TTL only reclaims decayed ones
+    "warn_counters": [IndexModel([("expires_at", 1)], expireAfterSeconds=0)],
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "groups": [
+        {"filter": {"chat_id": 0}},
+        {"filter": {"last_activity": {"$gte": datetime(2000, 1, 1)}}},
+    ],
+    "warnings": [
+        {"filter": {"chat_id": 0, "user_id": 0}},
+        {"filter": {"chat_id": 0}},
+    ],
+}
 
 # Fun responses and data
 WELCOME_MESSAGES = [
@@ -71,6 +128,22 @@ async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if chat.type not in ['group', 'supergroup']:
             return
             
+        # Store group info; bots count too, as they do in get_member_count
+        await journaled_write(
+            groups_collection, "update_one",
+            {"chat_id": chat.id},
+            {
+                "$set": {
+                    "chat_title": chat.title,
+                    "chat_type": chat.type,
+                    "last_activity": datetime.utcnow()
+                },
+                "$inc": {"member_count": len(update.message.new_chat_members)}
+            },
+            upsert=True
+        )
+        groups_cache.invalidate({"chat_id": chat.id})
+        
         for new_member in update.message.new_chat_members:
             if new_member.is_bot:
                 continue
@@ -84,20 +157,6 @@ async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
             
             await update.message.reply_text(welcome_msg, reply_markup=keyboard)
             
-            # Store group info
-            await groups_collection.update_one(
-                {"chat_id": chat.id},
-                {
-                    "$set": {
-                        "chat_title": chat.title,
-                        "chat_type": chat.type,
-                        "last_activity": datetime.utcnow()
-                    },
-                    "$inc": {"member_count": 1}
-                },
-                upsert=True
-            )
-            
     except Exception as e:
         await send_error_to_support(
             f"*❌ Welcome Member Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
@@ -115,6 +174,17 @@ async def goodbye_member(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if chat.type not in ['group', 'supergroup']:
             return
             
+        # Update group info
+        await journaled_write(
+            groups_collection, "update_one",
+            {"chat_id": chat.id},
+            {
+                "$set": {"last_activity": datetime.utcnow()},
+                "$inc": {"member_count": -1}
+            }
+        )
+        groups_cache.invalidate({"chat_id": chat.id})
+        
         left_member = update.message.left_chat_member
         if left_member.is_bot:
             return
@@ -124,20 +194,95 @@ async def goodbye_member(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         await update.message.reply_text(goodbye_msg)
         
-        # Update group info
-        await groups_collection.update_one(
-            {"chat_id": chat.id},
-            {
-                "$set": {"last_activity": datetime.utcnow()},
-                "$inc": {"member_count": -1}
-            }
-        )
-        
     except Exception as e:
         await send_error_to_support(
             f"*❌ Goodbye Member Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
         )
 
+async def _count_group_warnings(chat_id: int, delta: int) -> None:
+    await journaled_write(
+        groups_collection, "update_one",
+        {"chat_id": chat_id},
+        {"$inc": {"warning_count": delta}},
+        upsert=True
+    )
+    groups_cache.invalidate({"chat_id": chat_id})
+
+def _warn_key(chat_id: int, user_id: int) -> str:
+    return f"{chat_id}:{user_id}"
+
+async def add_warning(chat_id: int, user_id: int) -> int:
+    """
+    Atomically count one more warning for the user in this chat and return
+    the new total; a decayed counter starts again from 1
+    """
+    now = datetime.utcnow()
+    key = _warn_key(chat_id, user_id)
+    fields = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "last_warned": now,
+        "expires_at": now + timedelta(days=WARN_DECAY_DAYS)
+    }
+    for _ in range(3):
+        counter = await warn_counters_collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$inc": {"count": 1}, "$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+        if counter:
+            return counter["count"]
+        try:
+            # No live counter: reset a decayed one the TTL monitor hasn't removed yet, or create it
+            counter = await warn_counters_collection.find_one_and_update(
+                {"_id": key, "$or": [{"expires_at": {"$lte": now}}, {"expires_at": {"$exists": False}}]},
+                {"$set": {**fields, "count": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return counter["count"]
+        except DuplicateKeyError:
+            # A concurrent /warn created the counter first; increment it instead
+            continue
+    raise RuntimeError(f"Warning counter {key} kept changing during update")
+
+async def remove_warning(chat_id: int, user_id: int):
+    """
+    Take back one live warning; returns the remaining count, or None if there was none
+    """
+    counter = await warn_counters_collection.find_one_and_update(
+        {"_id": _warn_key(chat_id, user_id), "count": {"$gt": 0}, "expires_at": {"$gt": datetime.utcnow()}},
+        {"$inc": {"count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["count"] if counter else None
+
+async def get_warning_counter(chat_id: int, user_id: int):
+    return await warn_counters_collection.find_one(
+        {"_id": _warn_key(chat_id, user_id), "expires_at": {"$gt": datetime.utcnow()}}
+    )
+
+async def enforce_warn_limit(bot, chat_id: int, user_id: int):
+    """
+    Apply WARN_ACTION to a user who reached the limit; returns a line for the reply
+    """
+    if WARN_ACTION not in ("mute", "ban"):
+        return None
+    if not await bot_can_restrict(bot, chat_id):
+        return "🚫 I need the 'Ban users' admin right to act on this."
+
+    if WARN_ACTION == "ban":
+        await bot.ban_chat_member(chat_id, user_id)
+        result = "🔨 **User has been banned.**"
+    else:
+        until = datetime.utcnow() + timedelta(hours=WARN_MUTE_HOURS)
+        await bot.restrict_chat_member(chat_id, user_id, ChatPermissions.no_permissions(), until_date=until)
+        result = f"🔇 **User has been muted for {WARN_MUTE_HOURS:g}h.**"
+
+    # The penalty settles the account; the next warning starts a new count
+    await warn_counters_collection.delete_one({"_id": _warn_key(chat_id, user_id)})
+    return result
+
 async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Warn a user in the group
@@ -151,8 +296,7 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             return
             
         # Check if user is admin
-        member = await chat.get_member(user.id)
-        if member.status not in ['administrator', 'creator']:
+        if not await is_admin(context.bot, chat.id, user.id):
             await update.message.reply_text("❌ Only admins can warn users.")
             return
             
@@ -161,9 +305,19 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             return
             
         warned_user = update.message.reply_to_message.from_user
+        if await is_admin(context.bot, chat.id, warned_user.id):
+            await update.message.reply_text("❌ Admins can't be warned.")
+            return
         reason = " ".join(context.args) if context.args else "No reason provided"
         
-        # Add warning to database
+        # The counter decides on penalties, so it is written synchronously
+        try:
+            warning_count = await mongo_breaker.call(lambda: add_warning(chat.id, warned_user.id))
+        except STORAGE_ERRORS:
+            await update.message.reply_text("⚠️ Warnings are temporarily unavailable, try again shortly.")
+            return
+        
+        # Full history goes to the TTL-indexed log
         warning_data = {
             "chat_id": chat.id,
             "user_id": warned_user.id,
@@ -171,22 +325,19 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "reason": reason,
             "timestamp": datetime.utcnow()
         }
+        await journaled_write(warnings_collection, "insert_one", warning_data)
+        await _count_group_warnings(chat.id, 1)
         
-        await warnings_collection.insert_one(warning_data)
-        
-        # Count total warnings for this user in this chat
-        warning_count = await warnings_collection.count_documents({
-            "chat_id": chat.id,
-            "user_id": warned_user.id
-        })
-        
-        warning_text = f"⚠️ **Warning #{warning_count}**\n"
+        warning_text = f"⚠️ **Warning {warning_count}/{WARN_LIMIT}**\n"
         warning_text += f"**User:** {warned_user.first_name or warned_user.username}\n"
         warning_text += f"**Reason:** {reason}\n"
         warning_text += f"**Warned by:** {user.first_name or user.username}"
         
-        if warning_count >= 3:
-            warning_text += "\n\n🚨 **User has reached 3 warnings!**"
+        if warning_count >= WARN_LIMIT:
+            warning_text += f"\n\n🚨 **User has reached {WARN_LIMIT} warnings!**"
+            action = await enforce_warn_limit(context.bot, chat.id, warned_user.id)
+            if action:
+                warning_text += f"\n{action}"
             
         await update.message.reply_text(warning_text)
         
@@ -195,6 +346,69 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"*❌ Warn User Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
         )
 
+async def unwarn_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Remove the latest warning of a user (admin only)
+    """
+    try:
+        chat = update.effective_chat
+        user = update.effective_user
+        
+        if chat.type not in ['group', 'supergroup']:
+            await update.message.reply_text("❌ This command can only be used in groups.")
+            return
+            
+        if not await is_admin(context.bot, chat.id, user.id):
+            await update.message.reply_text("❌ Only admins can remove warnings.")
+            return
+            
+        if not update.message.reply_to_message:
+            await update.message.reply_text("❌ Reply to a message to remove a warning from the user.")
+            return
+            
+        target = update.message.reply_to_message.from_user
+        remaining = await remove_warning(chat.id, target.id)
+        if remaining is not None:
+            await _count_group_warnings(chat.id, -1)
+        
+        if remaining is None:
+            await update.message.reply_text(f"✅ {target.first_name or target.username} has no active warnings.")
+        else:
+            await update.message.reply_text(
+                f"✅ Warning removed from {target.first_name or target.username} ({remaining}/{WARN_LIMIT} left)."
+            )
+        
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Unwarn User Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def show_warnings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Show the active warning count of the replied-to user, or your own
+    """
+    try:
+        chat = update.effective_chat
+        
+        if chat.type not in ['group', 'supergroup']:
+            await update.message.reply_text("❌ This command can only be used in groups.")
+            return
+            
+        reply = update.message.reply_to_message
+        target = reply.from_user if reply else update.effective_user
+        counter = await get_warning_counter(chat.id, target.id)
+        count = counter["count"] if counter else 0
+        
+        warns_text = f"⚠️ **Warnings for {target.first_name or target.username}:** {count}/{WARN_LIMIT}"
+        if count:
+            warns_text += f"\n**Expire on:** {counter['expires_at'].strftime('%Y-%m-%d %H:%M')} UTC"
+        await update.message.reply_text(warns_text)
+        
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Show Warnings Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
 async def truth_or_dare(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Truth or Dare game
@@ -218,6 +432,83 @@ async def truth_or_dare(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             f"*❌ Truth or Dare Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
         )
 
+async def seed_group_stats(chat) -> dict:
+    """
+    First /groupstats in a group: take the member count from the API and
+    backfill the warning total from the log, once
+    """
+    fields = {
+        "member_count": await chat.get_member_count(),
+        "member_count_synced_at": datetime.utcnow(),
+        "chat_title": chat.title,
+        "chat_type": chat.type
+    }
+    try:
+        fields["warning_count"] = await mongo_breaker.call(
+            lambda: warnings_collection.count_documents({"chat_id": chat.id})
+        )
+        group_data = await mongo_breaker.call(lambda: groups_collection.find_one_and_update(
+            {"chat_id": chat.id},
+            {"$set": fields},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        ))
+    except STORAGE_ERRORS:
+        # Show what the API gave us, and cache it so /groupstats doesn't ask
+        # the API again on every call while Mongo is down; once the entry
+        # expires with Mongo back, the next call seeds for real
+        groups_cache.prime({"chat_id": chat.id}, fields)
+        return fields
+    groups_cache.prime({"chat_id": chat.id}, group_data)
+    return group_data
+
+async def sync_member_counts(bot) -> int:
+    """
+    Reconcile member_count with the Bot API for recently active groups
+    whose count was last synced more than MEMBER_SYNC_INTERVAL ago
+    """
+    now = datetime.utcnow()
+    cursor = groups_collection.find(
+        {
+            "last_activity": {"$gte": now - timedelta(hours=MEMBER_SYNC_ACTIVE_HOURS)},
+            "$or": [
+                {"member_count_synced_at": {"$lt": now - timedelta(seconds=MEMBER_SYNC_INTERVAL)}},
+                {"member_count_synced_at": {"$exists": False}}
+            ]
+        },
+        {"chat_id": 1}
+    ).limit(MEMBER_SYNC_BATCH)
+    groups = await mongo_breaker.call(lambda: cursor.to_list(length=MEMBER_SYNC_BATCH))
+
+    operations = []
+    for group in groups:
+        chat_id = group["chat_id"]
+        fields = {"member_count_synced_at": now}
+        try:
+            fields["member_count"] = await bot.get_member_count(chat_id)
+        except (BadRequest, Forbidden) as e:
+            # Removed from the chat; stamp it so it isn't retried every run
+            logger.info(f"Member count sync skipped chat {chat_id}: {e}")
+        operations.append(UpdateOne({"chat_id": chat_id}, {"$set": fields}))
+        groups_cache.invalidate({"chat_id": chat_id})
+
+    if operations:
+        await journaled_bulk_write(groups_collection, operations, ordered=False)
+    return len(operations)
+
+async def member_sync_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        synced = await sync_member_counts(context.bot)
+        if synced:
+            logger.info(f"Synced member counts of {synced} groups")
+    except STORAGE_ERRORS:
+        # Mongo is unavailable; the next run catches up
+        pass
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Member Sync Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
 async def group_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Show group statistics
@@ -229,23 +520,24 @@ async def group_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await update.message.reply_text("❌ This command can only be used in groups.")
             return
             
-        # Get group data
-        group_data = await groups_collection.find_one({"chat_id": chat.id})
-        
-        # Get member count
-        member_count = await chat.get_member_count()
-        
-        # Get warning count
-        warning_count = await warnings_collection.count_documents({"chat_id": chat.id})
+        # Counters are maintained by join/leave, /warn and the activity
+        # tracker, so this is one cached read and no Bot API call
+        try:
+            group_data = await groups_cache.find_one({"chat_id": chat.id})
+        except STORAGE_ERRORS:
+            # Mongo is down and nothing is cached; seeding caches what the API says
+            group_data = None
+        if not group_data or "member_count_synced_at" not in group_data:
+            group_data = await seed_group_stats(chat)
         
         stats_text = f"📊 **Group Statistics**\n\n"
         stats_text += f"**Group:** {chat.title}\n"
-        stats_text += f"**Members:** {member_count}\n"
-        stats_text += f"**Total Warnings:** {warning_count}\n"
+        stats_text += f"**Members:** {group_data.get('member_count', 0)}\n"
+        stats_text += f"**Total Warnings:** {group_data.get('warning_count', 0)}\n"
+        stats_text += f"**Messages:** {group_data.get('message_count', 0)}\n"
         
-        if group_data:
-            if group_data.get('last_activity'):
-                stats_text += f"**Last Activity:** {group_data['last_activity'].strftime('%Y-%m-%d %H:%M')}\n"
+        if group_data.get('last_activity'):
+            stats_text += f"**Last Activity:** {group_data['last_activity'].strftime('%Y-%m-%d %H:%M')}\n"
                 
         await update.message.reply_text(stats_text)
         
@@ -366,6 +658,8 @@ def setup(app: Application) -> None:
     
     # Command handlers
     app.add_handler(CommandHandler("warn", warn_user))
+    app.add_handler(CommandHandler("unwarn", unwarn_user))
+    app.add_handler(CommandHandler("warns", show_warnings))
     app.add_handler(CommandHandler("truthordare", truth_or_dare))
     app.add_handler(CommandHandler("tod", truth_or_dare))
     app.add_handler(CommandHandler("groupstats", group_stats))
@@ -375,6 +669,44 @@ def setup(app: Application) -> None:
     
     # Callback query handler for buttons
     app.add_handler(CallbackQueryHandler(button_callback, pattern="^(welcome_hi_|tod_)"))
+    
+    app.job_queue.run_repeating(
+        member_sync_job,
+        interval=MEMBER_SYNC_INTERVAL,
+        first=MEMBER_SYNC_INTERVAL,
+        name="member_count_sync"
+    )
+
+async def prepare_indexes() -> None:
+    """
+    Merge group documents that share a chat_id, left by concurrent upserts
+    from before chat_id was unique, so the unique index can be built
+    """
+    duplicates = await groups_collection.aggregate([
+        {"$group": {"_id": "$chat_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}}
+    ]).to_list(length=None)
+    for duplicate in duplicates:
+        documents = await groups_collection.find({"_id": {"$in": duplicate["ids"]}}).to_list(length=None)
+        # Keep the most recently active document and fold the others into it
+        documents.sort(key=lambda document: document.get("last_activity") or datetime.min, reverse=True)
+        keep = documents[0]
+        merged = {}
+        for document in documents[1:]:
+            for field, value in document.items():
+                if field not in keep and field != "_id":
+                    merged.setdefault(field, value)
+        for field in GROUP_COUNTERS:
+            if any(field in document for document in documents):
+                merged[field] = sum(document.get(field, 0) for document in documents)
+        # Seeded counts may now be summed twice; the next /groupstats reseeds them
+        merged.pop("member_count_synced_at", None)
+        update = {"$unset": {"member_count_synced_at": ""}}
+        if merged:
+            update["$set"] = merged
+        await groups_collection.update_one({"_id": keep["_id"]}, update)
+        await groups_collection.delete_many({"_id": {"$in": [document["_id"] for document in documents[1:]]}})
+        logger.info(f"Merged {len(documents)} group documents for chat {duplicate['_id']}")
 
 async def test() -> None:
     """
@@ -400,6 +732,8 @@ def get_info() -> dict:
         "version": "1.0.0",
         "commands": [
             "/warn - Warn a user (admin only)",
+            "/unwarn - Remove a user's latest warning (admin only)",
+            "/warns - Show active warnings",
             "/truthordare or /tod - Start a Truth or Dare game",
             "/groupstats - Show group statistics",
             "/randomfact or /fact - Get a random fun fact",
@@ -407,7 +741,7 @@ def get_info() -> dict:
         ],
         "features": [
             "Auto welcome/goodbye messages",
-            "Warning system for admins",
+            "Warning system with automatic mute/ban",
             "Truth or Dare game",
             "Group statistics tracking",
             "Random facts and magic 8-ball"
@@ -0,0 +1,473 @@
+"""
+Group Trivia Plugin for LunaBot
+Timed multiplayer trivia for groups: each round one question goes to the
+whole chat, the first correct answer within GROUP_TRIVIA_SECONDS scores,
+and the JobQueue moves the game on to the next round.
+
+Round state lives in memory and answers are decided without awaiting
+anything, so the first correct press wins even with concurrent updates.
+Mongo only sees one batched write per finished round, into the per-group
+answer stats /triviastats shows; points also go to the leaderboards.
+
+/stoptrivia can land while a round job is mid-await, so jobs re-check that
+their session is still the live one after every await, a round is closed
+and scored exactly once (_close_round) and a session is finished exactly
+once (finish_session).
+"""
+
+import os
+import time
+import random
+import itertools
+import traceback
+from datetime import datetime
+from typing import Dict, Optional
+from pymongo import IndexModel, UpdateOne
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from .db import db, send_error_to_support
+from .breaker import mongo_breaker
+from .journal import journaled_write, journaled_bulk_write
+from .callbacks import sign_callback, verify_callback, encode_int, decode_int
+from .question_bank import DIFFICULTIES, draw_question
+from .admin_cache import is_admin
+from .fun_games import TRIVIA_QUESTIONS, games_collection
+from .leaderboard import record_win
+
+trivia_scores_collection = db["trivia_scores"]
+
+GROUP_TRIVIA_SECONDS = float(os.getenv("GROUP_TRIVIA_SECONDS", "20"))
+GROUP_TRIVIA_PAUSE = float(os.getenv("GROUP_TRIVIA_PAUSE", "5"))
+GROUP_TRIVIA_ROUNDS = int(os.getenv("GROUP_TRIVIA_ROUNDS", "5"))
+GROUP_TRIVIA_MAX_ROUNDS = int(os.getenv("GROUP_TRIVIA_MAX_ROUNDS", "20"))
+GROUP_TRIVIA_POINTS = int(os.getenv("GROUP_TRIVIA_POINTS", "10"))
+# Players listed by /triviastats
+GROUP_TRIVIA_STATS_TOP = int(os.getenv("GROUP_TRIVIA_STATS_TOP", "10"))
+
+GROUP_TRIVIA_CALLBACK = "gt"
+
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "trivia_scores": [
+        IndexModel([("chat_id", 1), ("user_id", 1)], unique=True),
+        IndexModel([("chat_id", 1), ("points", -1)]),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "trivia_scores": [
+        {"filter": {"chat_id": 0, "user_id": 0}},
+        {"filter": {"chat_id": 0}, "sort": [("points", -1)]},
+    ]
+}
+
+# Games don't survive a restart; seeding round ids from the clock keeps a
+# button from before one from matching a new round
+_round_ids = itertools.count(int(time.time()))
+
+class TriviaRound:
+    def __init__(self, number: int, question: dict):
+        self.id = next(_round_ids)
+        self.number = number
+        self.question = question
+        self.message_id: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.winner: Optional[int] = None
+        self.winner_seconds: Optional[float] = None
+        self.answers: Dict[int, int] = {}
+        self.closed = False
+
+    def answer(self, user_id: int, option: int) -> str:
+        """
+        Record a press; returns "closed", "repeat", "first", "late" or "wrong".
+        Nothing here awaits, so the first correct press always wins.
+        """
+        if self.closed:
+            return "closed"
+        if user_id in self.answers:
+            return "repeat"
+        self.answers[user_id] = option
+        if option != self.question["correct"]:
+            return "wrong"
+        if self.winner is None:
+            self.winner = user_id
+            self.winner_seconds = (datetime.utcnow() - self.started_at).total_seconds()
+            return "first"
+        return "late"
+
+class TriviaSession:
+    def __init__(self, chat_id: int, started_by: int, rounds: int, category: Optional[str],
+                 difficulty: Optional[str]):
+        self.chat_id = chat_id
+        self.started_by = started_by
+        self.rounds = rounds
+        self.category = category
+        self.difficulty = difficulty
+        self.started_at = datetime.utcnow()
+        self.current: Optional[TriviaRound] = None
+        self.scores: Dict[int, int] = {}
+        self.names: Dict[int, str] = {}
+        self.finished = False
+
+sessions: Dict[int, TriviaSession] = {}
+
+def _is_live(session: TriviaSession) -> bool:
+    return sessions.get(session.chat_id) is session and not session.finished
+
+def _drop(session: TriviaSession) -> None:
+    if sessions.get(session.chat_id) is session:
+        del sessions[session.chat_id]
+
+def _job_name(chat_id: int) -> str:
+    return f"group_trivia_{chat_id}"
+
+def _schedule(context: ContextTypes.DEFAULT_TYPE, callback, delay: float, chat_id: int) -> None:
+    # A late round change beats a game that never moves on, so busy event
+    # loops must not make the scheduler drop it as misfired
+    context.job_queue.run_once(
+        callback, delay, data=chat_id, name=_job_name(chat_id),
+        job_kwargs={"misfire_grace_time": None}
+    )
+
+async def _pick_question(session: TriviaSession) -> dict:
+    question = await draw_question(
+        "trivia", session.chat_id, category=session.category, difficulty=session.difficulty
+    )
+    return question["data"] if question else random.choice(TRIVIA_QUESTIONS)
+
+async def start_round(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Job: post the next question and schedule its end
+    """
+    chat_id = context.job.data
+    session = sessions.get(chat_id)
+    if session is None:
+        return
+    try:
+        number = session.current.number + 1 if session.current else 1
+        trivia_round = TriviaRound(number, await _pick_question(session))
+        round_ref = encode_int(trivia_round.id)
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{chr(65+i)}. {option}",
+                callback_data=sign_callback(GROUP_TRIVIA_CALLBACK, round_ref, i)
+            )]
+            for i, option in enumerate(trivia_round.question["options"])
+        ])
+        question_text = f"🧠 **Round {number}/{session.rounds}**\n"
+        question_text += f"**Category:** {trivia_round.question['category']}\n\n"
+        question_text += f"**Question:** {trivia_round.question['question']}\n\n"
+        question_text += f"⏱ {GROUP_TRIVIA_SECONDS:g} seconds, first correct answer wins!"
+
+        if not _is_live(session):
+            # Stopped while the question was being drawn
+            return
+
+        message = await context.bot.send_message(chat_id, question_text, reply_markup=keyboard)
+        if not _is_live(session):
+            # Stopped while the question was being sent; don't leave it open
+            try:
+                await context.bot.edit_message_text(
+                    "🛑 **Trivia stopped.**", chat_id=chat_id, message_id=message.message_id
+                )
+            except TelegramError:
+                pass
+            return
+        trivia_round.message_id = message.message_id
+        session.current = trivia_round
+        _schedule(context, end_round, GROUP_TRIVIA_SECONDS, chat_id)
+    except Exception as e:
+        _drop(session)
+        await send_error_to_support(
+            f"*❌ Group Trivia Round Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def flush_round(session: TriviaSession, trivia_round: TriviaRound) -> None:
+    """
+    One unordered bulk write for everyone who answered in the round
+    """
+    operations = []
+    for user_id, option in trivia_round.answers.items():
+        inc = {"answered": 1, "correct": int(option == trivia_round.question["correct"])}
+        if user_id == trivia_round.winner:
+            inc.update({"wins": 1, "points": GROUP_TRIVIA_POINTS})
+        operations.append(UpdateOne(
+            {"chat_id": session.chat_id, "user_id": user_id},
+            {"$inc": inc, "$set": {"name": session.names.get(user_id), "last_played": datetime.utcnow()}},
+            upsert=True
+        ))
+    if operations:
+        await journaled_bulk_write(trivia_scores_collection, operations, ordered=False)
+
+def _close_round(session: TriviaSession, trivia_round: TriviaRound) -> bool:
+    """
+    Stop taking answers and credit the winner; False if the round was
+    already closed, so whoever closes it (end_round or /stoptrivia) is the
+    one to announce and flush it
+    """
+    if trivia_round.closed:
+        return False
+    trivia_round.closed = True
+    if trivia_round.winner is not None:
+        session.scores[trivia_round.winner] = session.scores.get(trivia_round.winner, 0) + GROUP_TRIVIA_POINTS
+        record_win(
+            session.chat_id, trivia_round.winner, session.names.get(trivia_round.winner),
+            "group_trivia", points=GROUP_TRIVIA_POINTS
+        )
+    return True
+
+def _round_result_text(session: TriviaSession, trivia_round: TriviaRound) -> str:
+    question = trivia_round.question
+    result_text = f"⏰ **Round {trivia_round.number}/{session.rounds} is over!**\n\n"
+    result_text += f"**Question:** {question['question']}\n"
+    result_text += f"**Answer:** {question['options'][question['correct']]}\n\n"
+    if trivia_round.winner is not None:
+        result_text += f"🏆 {session.names.get(trivia_round.winner)} was first "
+        result_text += f"in {trivia_round.winner_seconds:.1f}s (+{GROUP_TRIVIA_POINTS})"
+    else:
+        result_text += "😶 Nobody got it this time."
+    result_text += f"\n👥 {len(trivia_round.answers)} answered"
+    return result_text
+
+async def _announce_round(context: ContextTypes.DEFAULT_TYPE, session: TriviaSession,
+                          trivia_round: TriviaRound) -> None:
+    try:
+        await context.bot.edit_message_text(
+            _round_result_text(session, trivia_round),
+            chat_id=session.chat_id, message_id=trivia_round.message_id
+        )
+    except TelegramError:
+        # The question was deleted; the game goes on regardless
+        pass
+
+def _scoreboard(session: TriviaSession, limit: int = 10) -> str:
+    ranking = sorted(session.scores.items(), key=lambda item: -item[1])[:limit]
+    medals = ["🥇", "🥈", "🥉"]
+    return "\n".join(
+        f"{medals[i] if i < 3 else f'{i + 1}.'} {session.names.get(user_id, user_id)}: {points}"
+        for i, (user_id, points) in enumerate(ranking)
+    )
+
+async def end_round(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Job: close the round, show the result, flush scores and schedule what comes next
+    """
+    chat_id = context.job.data
+    session = sessions.get(chat_id)
+    if session is None or session.current is None:
+        return
+    trivia_round = session.current
+    if not _close_round(session, trivia_round):
+        # /stoptrivia already closed it
+        return
+    try:
+        await _announce_round(context, session, trivia_round)
+        await flush_round(session, trivia_round)
+
+        if not _is_live(session):
+            # Stopped while this round was being wrapped up; the stop finishes it
+            return
+        if trivia_round.number < session.rounds:
+            _schedule(context, start_round, GROUP_TRIVIA_PAUSE, chat_id)
+        else:
+            await finish_session(context, session)
+    except Exception as e:
+        _drop(session)
+        await send_error_to_support(
+            f"*❌ Group Trivia End Round Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def finish_session(context: ContextTypes.DEFAULT_TYPE, session: TriviaSession, stopped: bool = False) -> None:
+    """
+    Post the final scoreboard and record the game, once per session
+    """
+    if session.finished:
+        return
+    session.finished = True
+    _drop(session)
+    played = session.current.number if session.current else 0
+
+    final_text = "🛑 **Trivia stopped.**\n\n" if stopped else "🎉 **Trivia finished!**\n\n"
+    final_text += _scoreboard(session) or "No points scored."
+    await context.bot.send_message(session.chat_id, final_text)
+
+    await journaled_write(games_collection, "insert_one", {
+        "chat_id": session.chat_id,
+        "user_id": session.started_by,
+        "game_type": "group_trivia",
+        "rounds": played,
+        "scores": {str(user_id): points for user_id, points in session.scores.items()},
+        "start_time": session.started_at,
+        "end_time": datetime.utcnow(),
+        "status": "cancelled" if stopped else "completed"
+    })
+
+async def group_trivia_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Start timed trivia for the whole group: /grouptrivia [rounds] [category|difficulty]
+    """
+    try:
+        chat = update.effective_chat
+        if chat.type not in ['group', 'supergroup']:
+            await update.message.reply_text("❌ Group trivia can only be played in groups.")
+            return
+        if chat.id in sessions:
+            await update.message.reply_text("🧠 A trivia game is already running here! Use /stoptrivia to end it.")
+            return
+
+        args = list(context.args or [])
+        rounds = GROUP_TRIVIA_ROUNDS
+        if args and args[0].isdigit():
+            rounds = max(1, min(int(args.pop(0)), GROUP_TRIVIA_MAX_ROUNDS))
+        choice = " ".join(args) or None
+        difficulty = choice.lower() if choice and choice.lower() in DIFFICULTIES else None
+        category = choice if choice and not difficulty else None
+
+        sessions[chat.id] = TriviaSession(chat.id, update.effective_user.id, rounds, category, difficulty)
+        await update.message.reply_text(
+            f"🧠 **Group Trivia!**\n\n{rounds} rounds, {GROUP_TRIVIA_SECONDS:g}s each. "
+            f"The fastest correct answer scores {GROUP_TRIVIA_POINTS} points. Get ready..."
+        )
+        _schedule(context, start_round, GROUP_TRIVIA_PAUSE, chat.id)
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Group Trivia Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def stop_trivia_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Stop the running group trivia (whoever started it, or an admin)
+    """
+    try:
+        chat = update.effective_chat
+        session = sessions.get(chat.id)
+        if session is None:
+            await update.message.reply_text("❌ No trivia game is running here.")
+            return
+        user_id = update.effective_user.id
+        if user_id != session.started_by and not await is_admin(context.bot, chat.id, user_id):
+            await update.message.reply_text("❌ Only the player who started it or an admin can stop the game.")
+            return
+        if not _is_live(session):
+            # It finished (or was stopped) during the admin check
+            return
+
+        for job in context.job_queue.get_jobs_by_name(_job_name(chat.id)):
+            job.schedule_removal()
+        # Taking the session out first makes any round job mid-await stand down
+        _drop(session)
+        trivia_round = session.current
+        if trivia_round is not None and _close_round(session, trivia_round):
+            await _announce_round(context, session, trivia_round)
+            await flush_round(session, trivia_round)
+        await finish_session(context, session, stopped=True)
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Stop Trivia Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def trivia_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Show this group's trivia players with their wins and accuracy
+    """
+    try:
+        chat = update.effective_chat
+        if chat.type not in ['group', 'supergroup']:
+            await update.message.reply_text("❌ Group trivia stats are only available in groups.")
+            return
+        user = update.effective_user
+
+        players = await mongo_breaker.call(lambda: trivia_scores_collection.find(
+            {"chat_id": chat.id},
+            {"_id": 0, "user_id": 1, "name": 1, "points": 1, "wins": 1, "correct": 1, "answered": 1}
+        ).sort([("points", -1)]).limit(GROUP_TRIVIA_STATS_TOP).to_list(length=GROUP_TRIVIA_STATS_TOP))
+        own = next((player for player in players if player["user_id"] == user.id), None)
+        if own is None:
+            own = await mongo_breaker.call(
+                lambda: trivia_scores_collection.find_one({"chat_id": chat.id, "user_id": user.id})
+            )
+
+        def line(player: dict) -> str:
+            answered = player.get("answered", 0)
+            accuracy = player.get("correct", 0) / answered * 100 if answered else 0
+            return (f"{player.get('points', 0)} pts, {player.get('wins', 0)} wins, "
+                    f"{accuracy:.0f}% of {answered} answers correct")
+
+        stats_text = f"🧠 **Group Trivia Stats: {chat.title}**\n\n"
+        medals = ["🥇", "🥈", "🥉"]
+        for i, player in enumerate(players):
+            place = medals[i] if i < 3 else f"{i + 1}."
+            stats_text += f"{place} {player.get('name') or player['user_id']}: {line(player)}\n"
+        if not players:
+            stats_text += "No rounds played yet. Start one with /grouptrivia!\n"
+        if own is not None:
+            stats_text += f"\n**You:** {line(own)}"
+
+        await update.message.reply_text(stats_text)
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Trivia Stats Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def answer_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Answer presses are decided in memory; only the toast is sent back
+    """
+    try:
+        query = update.callback_query
+        fields = verify_callback(query.data, GROUP_TRIVIA_CALLBACK)
+        session = sessions.get(query.message.chat.id)
+        trivia_round = session.current if session else None
+        if fields is None or trivia_round is None or trivia_round.id != decode_int(fields[0]):
+            await query.answer("⏰ This round is over.")
+            return
+
+        user = query.from_user
+        session.names.setdefault(user.id, user.first_name or user.username or str(user.id))
+        result = trivia_round.answer(user.id, int(fields[1]))
+
+        responses = {
+            "closed": "⏰ This round is over.",
+            "repeat": "You already answered this round.",
+            "first": "✅ Correct, and you were first!",
+            "late": "✅ Correct, but someone was faster.",
+            "wrong": "❌ Wrong answer!"
+        }
+        await query.answer(responses[result])
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Group Trivia Answer Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(CommandHandler("grouptrivia", group_trivia_command))
+    app.add_handler(CommandHandler("stoptrivia", stop_trivia_command))
+    app.add_handler(CommandHandler("triviastats", trivia_stats_command))
+    app.add_handler(CallbackQueryHandler(answer_callback, pattern=f"^{GROUP_TRIVIA_CALLBACK}:"))
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Group Trivia",
+        "description": "Timed multiplayer trivia rounds for groups",
+        "version": "1.0.0",
+        "commands": [
+            "/grouptrivia [rounds] [category|difficulty] - Start timed trivia for the whole group",
+            "/stoptrivia - Stop the running group trivia",
+            "/triviastats - Show this group's trivia wins and accuracy"
+        ]
+    }
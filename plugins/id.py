@@ -1,28 +1,14 @@
-import os
 import traceback
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-SUPPORT_CHAT_ID = os.getenv("SUPPORT_CHAT_ID")
-
+from .db import send_error_to_support as report_error
 
 async def send_error_to_support(error: Exception, where="id_plugin"):
-    if not BOT_TOKEN or not SUPPORT_CHAT_ID:
-        return
-    bot = Bot(BOT_TOKEN)
-    try:
-        await bot.send_message(
-            chat_id=SUPPORT_CHAT_ID,
-            text=(
-                f"❗️ *Plugin Error: {where}*\n"
-                f"`{str(error)}`\n\n"
-                f"```{traceback.format_exc()}```"
-            )[:4000],
-            parse_mode="MarkdownV2"
-        )
-    except Exception:
-        pass
+    await report_error(
+        f"❗️ *Plugin Error: {where}*\n"
+        f"`{str(error)}`\n\n"
+        f"```{traceback.format_exc()}```"
+    )
 
 
 async def get_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -0,0 +1,350 @@
+"""
+Write Journal Plugin for LunaBot
+Degraded mode for non-critical writes: while Mongo is slow or down (see
+breaker.py) they are appended to a local journal instead of stalling the
+handler, and the journal is replayed in ordered batches once Mongo is back.
+
+A write that timed out may still have reached Mongo, so its outcome is
+unknown rather than failed. Such writes are journaled marked "uncertain",
+and a replay batch that times out leaves its lines uncertain too. Uncertain
+writes are only replayed when repeating them is harmless (inserts, which
+replay as upserts by _id, and $set-style updates); an uncertain $inc is
+dropped rather than risk counting it twice. Writes that never left the
+process (breaker open, no server) replay normally. A crash between a batch
+and its position update can still repeat that batch, which is why only
+non-critical writes go through here.
+
+Appends are fsynced, but a crash mid-append can still leave a torn last
+line; replay moves lines it can't parse to a .bad file and carries on.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+from telegram.ext import Application, ContextTypes
+from .db import db, notifier
+from .breaker import STORAGE_ERRORS, BreakerOpen, mongo_breaker
+
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "write_journal.jsonl")
+JOURNAL_REPLAY_INTERVAL = float(os.getenv("JOURNAL_REPLAY_INTERVAL", "15"))
+# Small batches keep the writes left uncertain by one timed-out batch few
+JOURNAL_REPLAY_BATCH = int(os.getenv("JOURNAL_REPLAY_BATCH", "100"))
+# Replay isn't on a handler's path, so it waits far longer than MONGO_OP_TIMEOUT
+JOURNAL_REPLAY_TIMEOUT = float(os.getenv("JOURNAL_REPLAY_TIMEOUT", "60"))
+
+# Failures raised before a write reached the server; anything else in
+# STORAGE_ERRORS (timeouts, dropped connections) leaves the outcome unknown
+NOT_SENT_ERRORS = (BreakerOpen, ServerSelectionTimeoutError)
+
+# Update operators that give the same document when applied twice
+IDEMPOTENT_OPERATORS = {"$set", "$setOnInsert", "$unset", "$min", "$max", "$addToSet", "$currentDate"}
+
+# Collection name -> callbacks run after each replayed upsert into it
+UPSERT_HOOKS: Dict[str, List[Callable[[dict], Awaitable[None]]]] = {}
+
+logger = logging.getLogger(__name__)
+
+def on_replayed_upsert(collection_name: str, callback: Callable[[dict], Awaitable[None]]) -> None:
+    """
+    Run callback(record) after each replayed upsert into the collection, for
+    follow-up work the caller skipped because it couldn't tell whether its
+    write inserted. A record can be replayed more than once, and a timed-out
+    original may have inserted already, so callbacks must check for
+    themselves and be idempotent.
+    """
+    UPSERT_HOOKS.setdefault(collection_name, []).append(callback)
+
+class WriteJournal:
+    """
+    Append-only JSON-lines file of pending writes. Replay first moves the
+    file aside, so new writes keep appending while old ones are applied,
+    and records its progress next to it so a restart resumes mid-file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.replay_path = f"{path}.replay"
+        self.position_path = f"{path}.replay.pos"
+        self.bad_path = f"{path}.bad"
+        self.appended = 0
+        self.replayed = 0
+        self._file = None
+        self._lock = asyncio.Lock()
+        # Whether the batch being applied has had any bulk write go through
+        self._wrote = False
+
+    def append(self, record: dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a+", encoding="utf-8")
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    # Torn by a crash mid-append; don't glue the next record onto it
+                    self._file.write("\n")
+        self._file.write(json_util.dumps(record, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.appended += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def pending(self) -> bool:
+        return os.path.exists(self.replay_path) or (
+            os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        )
+
+    def _read_position(self) -> Tuple[int, int]:
+        """
+        Lines already replayed, and how many after them have an unknown outcome
+        """
+        try:
+            with open(self.position_path, "r") as f:
+                fields = [int(field) for field in f.read().split()] + [0, 0]
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+        return fields[0], fields[1]
+
+    def _write_position(self, position: int, uncertain: int = 0) -> None:
+        with open(self.position_path, "w") as f:
+            f.write(f"{position} {uncertain}")
+
+    @staticmethod
+    def _to_request(record: dict):
+        if record["op"] == "insert_one":
+            # The _id was fixed when journaled, so a repeat is a no-op
+            return UpdateOne({"_id": record["doc"]["_id"]}, {"$setOnInsert": record["doc"]}, upsert=True)
+        if record["op"] == "update_many":
+            return UpdateMany(record["filter"], record["update"], upsert=record.get("upsert", False))
+        return UpdateOne(record["filter"], record["update"], upsert=record.get("upsert", False))
+
+    @staticmethod
+    def _parse(lines: List[str]) -> Tuple[List[dict], List[str]]:
+        """
+        Records from the lines that parse, and the lines that don't
+        """
+        records, unreadable = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json_util.loads(line))
+            except ValueError:
+                unreadable.append(line if line.endswith("\n") else line + "\n")
+        return records, unreadable
+
+    def _set_aside(self, lines: List[str]) -> None:
+        logger.error(f"Journal replay set aside {len(lines)} unreadable lines in {self.bad_path}")
+        with open(self.bad_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    @staticmethod
+    def _idempotent(record: dict) -> bool:
+        return record["op"] == "insert_one" or set(record["update"]) <= IDEMPOTENT_OPERATORS
+
+    async def _apply(self, records: List[dict]) -> None:
+        # Consecutive records for one collection go out as one ordered bulk write
+        self._wrote = False
+        start = 0
+        while start < len(records):
+            end = start
+            while end < len(records) and records[end]["c"] == records[start]["c"]:
+                end += 1
+            batch = records[start:end]
+            collection = db[records[start]["c"]]
+            while batch:
+                requests = [self._to_request(record) for record in batch]
+                try:
+                    await mongo_breaker.call(
+                        lambda: collection.bulk_write(requests, ordered=True),
+                        timeout=JOURNAL_REPLAY_TIMEOUT
+                    )
+                    written, applied = batch, len(batch)
+                except BulkWriteError as e:
+                    # Drop the write Mongo rejected and carry on after it
+                    failed = e.details["writeErrors"][0]
+                    logger.error(f"Journal replay dropped a write to {collection.name}: {failed.get('errmsg')}")
+                    written, applied = batch[:failed["index"]], failed["index"] + 1
+                self._wrote = True
+                for record in written:
+                    await self._run_upsert_hooks(record)
+                batch = batch[applied:]
+            start = end
+
+    @staticmethod
+    async def _run_upsert_hooks(record: dict) -> None:
+        if record["op"] == "insert_one" or not record.get("upsert"):
+            return
+        for callback in UPSERT_HOOKS.get(record["c"], []):
+            try:
+                await callback(record)
+            except Exception as e:
+                logger.error(f"Journal replay hook for {record['c']} failed: {e}")
+
+    async def replay(self) -> int:
+        """
+        Apply journaled writes in batches; stops quietly when Mongo fails again
+        """
+        async with self._lock:
+            if not os.path.exists(self.replay_path):
+                if not self.pending():
+                    return 0
+                self.close()
+                os.replace(self.path, self.replay_path)
+                self._write_position(0)
+
+            position, uncertain = self._read_position()
+            applied = 0
+            with open(self.replay_path, "r", encoding="utf-8") as f:
+                for _ in range(position):
+                    f.readline()
+                while True:
+                    # Uncertain lines are read as a batch of their own
+                    size = min(uncertain, JOURNAL_REPLAY_BATCH) if uncertain else JOURNAL_REPLAY_BATCH
+                    lines = [f.readline() for _ in range(size)]
+                    count = sum(1 for line in lines if line)
+                    if not count:
+                        break
+                    records, unreadable = self._parse(lines)
+                    replayable = [
+                        record for record in records
+                        if self._idempotent(record) or not (uncertain or record.get("uncertain"))
+                    ]
+                    if len(replayable) < len(records):
+                        logger.warning(
+                            f"Journal replay skipped {len(records) - len(replayable)} non-idempotent "
+                            f"writes that may already have been applied"
+                        )
+                    try:
+                        await self._apply(replayable)
+                    except STORAGE_ERRORS as e:
+                        if isinstance(e, NOT_SENT_ERRORS) and not self._wrote:
+                            # Nothing reached Mongo; retry the batch as it is
+                            return applied
+                        # Mongo may have applied some or all of the batch
+                        self._write_position(position, max(uncertain, count))
+                        return applied
+                    if unreadable:
+                        self._set_aside(unreadable)
+                    position += count
+                    uncertain = max(0, uncertain - count)
+                    applied += len(replayable)
+                    self.replayed += len(replayable)
+                    self._write_position(position, uncertain)
+
+            os.remove(self.replay_path)
+            os.remove(self.position_path)
+            return applied
+
+journal = WriteJournal(JOURNAL_PATH)
+
+def _journal(collection, op: str, args: tuple, kwargs: dict, error: Exception) -> None:
+    if op == "insert_one":
+        record = {"c": collection.name, "op": op, "doc": args[0]}
+    elif op in ("update_one", "update_many"):
+        record = {
+            "c": collection.name,
+            "op": op,
+            "filter": args[0],
+            "update": args[1],
+            "upsert": kwargs.get("upsert", args[2] if len(args) > 2 else False)
+        }
+    else:
+        raise ValueError(f"{op} can not be journaled")
+    if not isinstance(error, NOT_SENT_ERRORS):
+        # Timed out or cut off mid-flight: Mongo may have applied it anyway
+        record["uncertain"] = True
+    journal.append(record)
+
+async def journaled_write(collection, op: str, *args, **kwargs) -> Optional[Any]:
+    """
+    Run a non-critical insert_one/update_one/update_many under the breaker;
+    when Mongo is slow or down, journal it for replay and return None
+    """
+    if op == "insert_one":
+        # Fix the _id up front, as the driver would, so a replay can't duplicate it
+        args[0].setdefault("_id", ObjectId())
+    try:
+        return await mongo_breaker.call(lambda: getattr(collection, op)(*args, **kwargs))
+    except STORAGE_ERRORS as e:
+        _journal(collection, op, args, kwargs, e)
+        return None
+
+async def journaled_bulk_write(collection, requests: List[Any], ordered: bool = False) -> Optional[Any]:
+    """
+    bulk_write under the breaker, journaling every request when Mongo is unavailable
+    """
+    for request in requests:
+        if isinstance(request, InsertOne):
+            request._doc.setdefault("_id", ObjectId())
+    try:
+        return await mongo_breaker.call(lambda: collection.bulk_write(requests, ordered=ordered))
+    except STORAGE_ERRORS as e:
+        for request in requests:
+            if isinstance(request, InsertOne):
+                _journal(collection, "insert_one", (request._doc,), {}, e)
+            else:
+                op = "update_many" if isinstance(request, UpdateMany) else "update_one"
+                _journal(collection, op, (request._filter, request._doc), {"upsert": bool(request._upsert)}, e)
+        return None
+
+def _announce(state: str) -> None:
+    if state == "open":
+        notifier.log("🔌 *MongoDB unavailable*, non\\-critical writes are being journaled")
+    elif state == "closed":
+        notifier.log("🔌 *MongoDB reachable again*, replaying the write journal")
+
+mongo_breaker.on_change(_announce)
+
+async def replay_journal() -> None:
+    if not journal.pending() or mongo_breaker.is_open:
+        return
+    applied = await journal.replay()
+    if applied:
+        logger.info(f"Replayed {applied} journaled writes")
+
+async def replay_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await replay_journal()
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.job_queue.run_repeating(
+        replay_job,
+        interval=JOURNAL_REPLAY_INTERVAL,
+        first=JOURNAL_REPLAY_INTERVAL,
+        name="journal_replay"
+    )
+
+async def test() -> None:
+    """
+    Test function to verify the journal file is writable
+    """
+    with open(JOURNAL_PATH, "a", encoding="utf-8"):
+        pass
+
+async def startup(app: Application) -> None:
+    """
+    Replay whatever a previous run left behind
+    """
+    await replay_journal()
+
+async def shutdown(app: Application) -> None:
+    journal.close()
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Write Journal",
+        "description": "Keeps non-critical writes on disk while MongoDB is unavailable",
+        "version": "1.0.0"
+    }
@@ -0,0 +1,98 @@
+"""
+Lazy Plugin Loading for LunaBot
+Registers stub handlers from plugins/manifest.json and imports the real
+plugin module only when one of its commands or buttons is first used
+"""
+
+import os
+import json
+import asyncio
+import importlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CallbackQueryHandler, CommandHandler, ContextTypes
+from .metrics import snapshot_handlers, added_handlers, instrument_handlers
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifest.json")
+
+# Set LAZY_PLUGINS=0 to import every plugin at boot regardless of the manifest
+LAZY_PLUGINS = os.getenv("LAZY_PLUGINS", "1") != "0"
+
+logger = logging.getLogger(__name__)
+
+def load_manifest() -> Dict[str, Dict[str, Any]]:
+    """
+    Read the lazy plugin manifest; plugins listed here are not imported at boot
+    """
+    if not LAZY_PLUGINS:
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+class LazyPlugin:
+    """
+    Stands in for a plugin until its first update arrives. Stubs are built
+    from the manifest's "commands" and "callbacks"; on first use the module is
+    imported, its setup() runs, the stubs are removed and the triggering
+    update is handed to the plugin's own handler.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        name: str,
+        spec: Dict[str, Any],
+        package: str = "plugins",
+        on_load: Optional[Callable[[str, Any], Awaitable[None]]] = None,
+    ):
+        self.app = app
+        self.name = name
+        self.spec = spec
+        self.package = package
+        self.on_load = on_load
+        self.module = None
+        self.handlers: List[BaseHandler] = []
+        self._stubs: List[BaseHandler] = []
+        self._lock = asyncio.Lock()
+
+    def register(self) -> None:
+        if self.spec.get("commands"):
+            self._stubs.append(CommandHandler(self.spec["commands"], self.dispatch))
+        for pattern in self.spec.get("callbacks", []):
+            self._stubs.append(CallbackQueryHandler(self.dispatch, pattern=pattern))
+        for stub in self._stubs:
+            self.app.add_handler(stub)
+
+    def get_info(self) -> dict:
+        return {key: self.spec[key] for key in ("name", "description") if key in self.spec}
+
+    async def load(self) -> List[BaseHandler]:
+        async with self._lock:
+            if self.module is not None:
+                return self.handlers
+
+            module = await asyncio.to_thread(importlib.import_module, f"{self.package}.{self.name}")
+            before = snapshot_handlers(self.app)
+            if hasattr(module, "setup"):
+                module.setup(self.app)
+            self.handlers = added_handlers(self.app, before)
+            instrument_handlers(self.name, self.handlers)
+            for stub in self._stubs:
+                self.app.remove_handler(stub)
+
+            if self.on_load:
+                await self.on_load(self.name, module)
+            self.module = module
+            logger.info(f"💤 Lazy plugin {self.name} loaded on first use")
+            return self.handlers
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        for handler in await self.load():
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                await handler.handle_update(update, self.app, check, context)
+                return
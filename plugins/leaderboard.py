@@ -0,0 +1,314 @@
+"""
+Leaderboard Plugin for LunaBot
+Global and per-chat game scores for today, this week and all time, kept up
+to date by the game completion paths instead of aggregating game history.
+
+Scores are $inc'd in Mongo in batches. Boards that are being looked at are
+also held in memory as lists sorted with bisect, so top-N is a slice and a
+player's rank is a binary search. A board is read from Mongo already in
+that order, so loading one is a single pass.
+"""
+
+import os
+import asyncio
+import logging
+import traceback
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo import IndexModel, UpdateOne
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+from .db import db, send_error_to_support
+from .breaker import mongo_breaker
+from .journal import journaled_bulk_write
+
+leaderboard_collection = db["leaderboard"]
+
+LEADERBOARD_FLUSH_INTERVAL = float(os.getenv("LEADERBOARD_FLUSH_INTERVAL", "10"))
+# Boards held in memory at once; the least recently viewed is dropped first
+LEADERBOARD_MAX_BOARDS = int(os.getenv("LEADERBOARD_MAX_BOARDS", "1000"))
+LEADERBOARD_TOP = int(os.getenv("LEADERBOARD_TOP", "10"))
+
+# Points per win; a hint halves them
+GAME_POINTS = {
+    "trivia": 10,
+    "riddle": 15,
+    "word": 15,
+    "group_trivia": 10
+}
+
+GLOBAL_SCOPE = "global"
+PERIODS = ("day", "week", "all")
+PERIOD_NAMES = {"day": "Today", "week": "This Week", "all": "All Time"}
+
+logger = logging.getLogger(__name__)
+
+# Board order: highest score first, ties to the lower user id
+BOARD_SORT = [("points", -1), ("user_id", 1)]
+
+# Indexes reconciled by the plugin loader at boot. Daily and weekly scores
+# expire once their period is well over; all-time scores have no expires_at.
+INDEXES = {
+    "leaderboard": [
+        IndexModel([("scope", 1), ("period", 1)] + BOARD_SORT),
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "leaderboard": [
+        {"filter": {"scope": GLOBAL_SCOPE, "period": "all"}, "sort": BOARD_SORT},
+    ]
+}
+
+def period_keys(now: Optional[datetime] = None) -> Dict[str, Tuple[str, Optional[datetime]]]:
+    """
+    Current key of each period, with when its scores may be deleted
+    """
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    year, week, _ = now.isocalendar()
+    monday = today - timedelta(days=today.weekday())
+    return {
+        "day": (f"d{today:%Y%m%d}", today + timedelta(days=2)),
+        "week": (f"w{year}{week:02d}", monday + timedelta(days=14)),
+        "all": ("all", None)
+    }
+
+class RankedBoard:
+    """
+    Points by user plus (-points, user_id) pairs kept sorted, so the order
+    is highest score first and ties go to the lower user id
+    """
+
+    def __init__(self):
+        self.points: Dict[int, int] = {}
+        self.names: Dict[int, str] = {}
+        self.order: List[Tuple[int, int]] = []
+
+    @classmethod
+    def load(cls, documents: List[dict], pending: List[dict]) -> "RankedBoard":
+        """
+        Build a board from documents in BOARD_SORT order plus unflushed
+        entries. Sorting once is linear on the already-sorted documents,
+        where add() per document would be quadratic.
+        """
+        board = cls()
+        for document in documents:
+            board.points[document["user_id"]] = document.get("points", 0)
+            if document.get("name"):
+                board.names[document["user_id"]] = document["name"]
+        for entry in pending:
+            board.points[entry["user_id"]] = board.points.get(entry["user_id"], 0) + entry["points"]
+            if entry["name"]:
+                board.names[entry["user_id"]] = entry["name"]
+        board.order = sorted((-points, user_id) for user_id, points in board.points.items())
+        return board
+
+    def add(self, user_id: int, delta: int, name: Optional[str] = None) -> None:
+        old = self.points.get(user_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, user_id))]
+        self.points[user_id] = (old or 0) + delta
+        insort(self.order, (-self.points[user_id], user_id))
+        if name:
+            self.names[user_id] = name
+
+    def top(self, limit: int) -> List[Tuple[int, int, Optional[str]]]:
+        return [(user_id, -negative, self.names.get(user_id)) for negative, user_id in self.order[:limit]]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """
+        1 + players with strictly more points, so ties share a rank
+        """
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return bisect_left(self.order, (-points, float("-inf"))) + 1
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+class Leaderboards:
+    def __init__(self):
+        # Unflushed increments by document _id
+        self.pending: Dict[str, dict] = {}
+        self.boards: "OrderedDict[Tuple[str, str], RankedBoard]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def record(self, chat_id: int, user_id: int, name: Optional[str], points: int) -> None:
+        scopes = [GLOBAL_SCOPE]
+        if chat_id != user_id:
+            # A private chat's board would only ever hold its one player
+            scopes.append(str(chat_id))
+        for scope in scopes:
+            for period, expires_at in period_keys().values():
+                _id = f"{scope}:{period}:{user_id}"
+                entry = self.pending.get(_id)
+                if entry is None:
+                    entry = self.pending[_id] = {
+                        "scope": scope, "period": period, "user_id": user_id,
+                        "expires_at": expires_at, "points": 0, "games": 0
+                    }
+                entry["points"] += points
+                entry["games"] += 1
+                entry["name"] = name
+
+                board = self.boards.get((scope, period))
+                if board is not None:
+                    board.add(user_id, points, name)
+
+    async def flush(self) -> int:
+        """
+        Apply pending increments with unordered bulk upserts
+        """
+        async with self._lock:
+            return await self._flush()
+
+    async def _flush(self) -> int:
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        operations = []
+        for _id, entry in pending.items():
+            on_insert = {"scope": entry["scope"], "period": entry["period"], "user_id": entry["user_id"]}
+            if entry["expires_at"] is not None:
+                on_insert["expires_at"] = entry["expires_at"]
+            operations.append(UpdateOne(
+                {"_id": _id},
+                {
+                    "$inc": {"points": entry["points"], "games": entry["games"]},
+                    "$set": {"name": entry["name"]},
+                    "$setOnInsert": on_insert
+                },
+                upsert=True
+            ))
+        await journaled_bulk_write(leaderboard_collection, operations, ordered=False)
+        return len(operations)
+
+    async def board(self, scope: str, period: str) -> RankedBoard:
+        """
+        The in-memory board for a scope and period key, loaded from Mongo once
+        """
+        key = (scope, period)
+        board = self.boards.get(key)
+        if board is not None:
+            self.boards.move_to_end(key)
+            return board
+
+        async with self._lock:
+            board = self.boards.get(key)
+            if board is not None:
+                return board
+            # Holding the lock keeps a flush from landing between the read
+            # and adding what is still pending, which would count it twice
+            documents = await mongo_breaker.call(lambda: leaderboard_collection.find(
+                {"scope": scope, "period": period},
+                {"user_id": 1, "points": 1, "name": 1}
+            ).sort(BOARD_SORT).to_list(length=None))
+            board = RankedBoard.load(documents, [
+                entry for entry in self.pending.values()
+                if entry["scope"] == scope and entry["period"] == period
+            ])
+
+            self.boards[key] = board
+            while len(self.boards) > LEADERBOARD_MAX_BOARDS:
+                self.boards.popitem(last=False)
+            return board
+
+leaderboards = Leaderboards()
+
+def game_points(game_type: str, hint_used: bool = False) -> int:
+    points = GAME_POINTS.get(game_type, 10)
+    return points // 2 if hint_used else points
+
+def record_win(chat_id: int, user_id: int, name: Optional[str], game_type: str,
+               hint_used: bool = False, points: Optional[int] = None) -> int:
+    """
+    Credit a finished game to the player's boards; returns the points given.
+    Never waits on Mongo, so completion paths can call it inline.
+    """
+    if points is None:
+        points = game_points(game_type, hint_used)
+    leaderboards.record(chat_id, user_id, name, points)
+    return points
+
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Show the leaderboard: /leaderboard [global|chat] [day|week|all]
+    """
+    try:
+        chat = update.effective_chat
+        user = update.effective_user
+        args = [arg.lower() for arg in context.args or []]
+
+        in_group = chat.type in ['group', 'supergroup']
+        scope = GLOBAL_SCOPE if "global" in args or not in_group else str(chat.id)
+        period = next((arg for arg in args if arg in PERIODS), "all")
+
+        board = await leaderboards.board(scope, period_keys()[period][0])
+        title = "🌍 Global" if scope == GLOBAL_SCOPE else f"👥 {chat.title}"
+        board_text = f"🏆 **{title} Leaderboard: {PERIOD_NAMES[period]}**\n\n"
+
+        medals = ["🥇", "🥈", "🥉"]
+        rows = board.top(LEADERBOARD_TOP)
+        for i, (user_id, points, name) in enumerate(rows):
+            place = medals[i] if i < 3 else f"{i + 1}."
+            board_text += f"{place} {name or user_id}: {points}\n"
+        if not rows:
+            board_text += "No games won yet. Try /trivia, /riddle or /wordgame!\n"
+
+        rank = board.rank(user.id)
+        if rank is not None:
+            board_text += f"\n**Your rank:** #{rank} of {len(board)} with {board.points[user.id]} points"
+
+        await update.message.reply_text(board_text)
+    except Exception as e:
+        await send_error_to_support(
+            f"*❌ Leaderboard Error:*\n`{str(e)}`\n```{traceback.format_exc()}```"
+        )
+
+async def flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await leaderboards.flush()
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    app.add_handler(CommandHandler("top", leaderboard_command))
+    app.job_queue.run_repeating(
+        flush_job,
+        interval=LEADERBOARD_FLUSH_INTERVAL,
+        first=LEADERBOARD_FLUSH_INTERVAL,
+        name="leaderboard_flush"
+    )
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+async def shutdown(app: Application) -> None:
+    """
+    Write out scores still pending
+    """
+    await leaderboards.flush()
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Leaderboard",
+        "description": "Global and per-chat game leaderboards",
+        "version": "1.0.0",
+        "commands": [
+            "/leaderboard [global] [day|week|all] - Show the top players",
+            "/top - Same as /leaderboard"
+        ]
+    }
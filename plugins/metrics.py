@@ -0,0 +1,382 @@
+"""
+Metrics Plugin for LunaBot
+Instruments every handler registered through a plugin's setup() with call,
+error and latency metrics, plus Mongo command timings and round trips per
+handler call, served in Prometheus text format and through the owner-only
+/perf command
+"""
+
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from pymongo import monitoring
+from .cache import CACHES
+from .breaker import mongo_breaker
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CommandHandler, ContextTypes, TypeHandler
+
+# Latency histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recent samples kept per handler for /perf percentiles
+SAMPLE_WINDOW = 1024
+# Bucket bounds for Mongo round trips made by one handler call
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+# Mongo commands slower than this are logged with the handler that issued them
+MONGO_SLOW_MS = float(os.getenv("MONGO_SLOW_MS", "100"))
+
+# The metrics HTTP server only starts when METRICS_PORT is set
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# One update can run a handler in several groups, so updates are counted by a
+# catch-all handler in a group of their own rather than per handler call
+UPDATE_COUNTER_GROUP = -1
+
+class HandlerStats:
+    def __init__(self, plugin: str, handler: str):
+        self.plugin = plugin
+        self.handler = handler
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.db_calls = 0
+        self.db_time = 0.0
+        self.round_trip_buckets = [0] * (len(ROUND_TRIP_BUCKETS) + 1)
+
+    def observe(self, seconds: float, round_trips: int = 0) -> None:
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+        self.round_trip_buckets[bisect.bisect_left(ROUND_TRIP_BUCKETS, round_trips)] += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+HANDLER_STATS: Dict[Tuple[str, str], HandlerStats] = {}
+
+# Stats of the handler currently running, so code deeper in the call stack
+# (error reporting, DB monitoring) can attribute its work to it
+current_handler: contextvars.ContextVar[Optional[HandlerStats]] = contextvars.ContextVar(
+    "current_handler", default=None
+)
+
+# Mongo round trips made so far by the running handler call; a one-item list
+# so the command listener can bump it from motor's executor threads
+current_round_trips: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "current_round_trips", default=None
+)
+
+logger = logging.getLogger(__name__)
+
+class CommandStats:
+    def __init__(self, command: str, collection: str):
+        self.command = command
+        self.collection = collection
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+COMMAND_STATS: Dict[Tuple[str, str], CommandStats] = {}
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    pymongo listener timing every command per name and collection. Motor runs
+    commands in executor threads with a copy of the caller's context, so the
+    issuing handler is read from current_handler when the command starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else event.command.get("collection", "")
+        trips = current_round_trips.get()
+        with self._lock:
+            if trips is not None:
+                trips[0] += 1
+            self._pending[(event.connection_id, event.request_id)] = (collection, current_handler.get())
+
+    def _finish(self, event, failed: bool) -> None:
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is None:
+                return
+            collection, handler = pending
+            seconds = event.duration_micros / 1e6
+            key = (event.command_name, collection)
+            stats = COMMAND_STATS.get(key)
+            if stats is None:
+                stats = COMMAND_STATS[key] = CommandStats(event.command_name, collection)
+            stats.count += 1
+            stats.failures += failed
+            stats.total += seconds
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if handler is not None:
+                handler.db_calls += 1
+                handler.db_time += seconds
+
+        if seconds * 1000 >= MONGO_SLOW_MS:
+            source = f"{handler.plugin}.{handler.handler}" if handler else "background"
+            logger.warning(
+                f"🐢 Slow Mongo {event.command_name} on {collection or '-'}: "
+                f"{seconds * 1000:.0f}ms from {source}{' (failed)' if failed else ''}"
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, True)
+
+# Registered on the shared Mongo client in plugins/db.py
+command_metrics = CommandMetrics()
+
+# Updates dispatched, counted once each however many handlers they reach
+updates_total = 0
+
+async def count_update(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global updates_total
+    updates_total += 1
+
+# Not a plugin handler; the loader must not give it latency metrics of its own
+count_update.__instrumented__ = True
+
+def handler_stats(plugin: str, handler: str) -> HandlerStats:
+    key = (plugin, handler)
+    if key not in HANDLER_STATS:
+        HANDLER_STATS[key] = HandlerStats(plugin, handler)
+    return HANDLER_STATS[key]
+
+def note_handler_error() -> None:
+    """
+    Count an error the running handler caught and reported itself
+    """
+    stats = current_handler.get()
+    if stats is not None:
+        stats.errors += 1
+
+def snapshot_handlers(app: Application) -> Dict[int, List[BaseHandler]]:
+    return {group: list(handlers) for group, handlers in app.handlers.items()}
+
+def added_handlers(app: Application, before: Dict[int, List[BaseHandler]]) -> List[BaseHandler]:
+    return [
+        handler
+        for group, handlers in app.handlers.items()
+        for handler in handlers
+        if handler not in before.get(group, [])
+    ]
+
+def instrument_handler(plugin: str, handler: BaseHandler) -> None:
+    callback = getattr(handler, "callback", None)
+    if not callable(callback) or getattr(callback, "__instrumented__", False):
+        return
+    stats = handler_stats(plugin, getattr(callback, "__name__", type(handler).__name__))
+
+    @functools.wraps(callback)
+    async def instrumented(update: object, context: ContextTypes.DEFAULT_TYPE):
+        token = current_handler.set(stats)
+        trips = [0]
+        trips_token = current_round_trips.set(trips)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.observe(time.perf_counter() - started, trips[0])
+            current_round_trips.reset(trips_token)
+            current_handler.reset(token)
+
+    instrumented.__instrumented__ = True
+    handler.callback = instrumented
+
+def instrument_handlers(plugin: str, handlers: List[BaseHandler]) -> None:
+    for handler in handlers:
+        instrument_handler(plugin, handler)
+
+def _labels(stats: HandlerStats, **extra) -> str:
+    labels = {"plugin": stats.plugin, "handler": stats.handler, **extra}
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+def render_prometheus() -> str:
+    """
+    All handler metrics in Prometheus text exposition format
+    """
+    lines = [
+        "# HELP lunabot_updates_total Updates dispatched",
+        "# TYPE lunabot_updates_total counter",
+        f"lunabot_updates_total {updates_total}",
+        "# HELP lunabot_handler_latency_seconds Handler latency",
+        "# TYPE lunabot_handler_latency_seconds histogram",
+    ]
+    for stats in HANDLER_STATS.values():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), stats.buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"lunabot_handler_latency_seconds_bucket{{{_labels(stats, le=le)}}} {cumulative}")
+        lines.append(f"lunabot_handler_latency_seconds_sum{{{_labels(stats)}}} {stats.total:.6f}")
+        lines.append(f"lunabot_handler_latency_seconds_count{{{_labels(stats)}}} {stats.count}")
+
+    lines += [
+        "# HELP lunabot_handler_errors_total Handler errors",
+        "# TYPE lunabot_handler_errors_total counter",
+    ]
+    for stats in HANDLER_STATS.values():
+        lines.append(f"lunabot_handler_errors_total{{{_labels(stats)}}} {stats.errors}")
+
+    lines += [
+        "# HELP lunabot_handler_db_round_trips Mongo round trips per handler call",
+        "# TYPE lunabot_handler_db_round_trips histogram",
+    ]
+    for stats in HANDLER_STATS.values():
+        cumulative = 0
+        for bound, count in zip(ROUND_TRIP_BUCKETS + (float("inf"),), stats.round_trip_buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"lunabot_handler_db_round_trips_bucket{{{_labels(stats, le=le)}}} {cumulative}")
+        lines.append(f"lunabot_handler_db_round_trips_sum{{{_labels(stats)}}} {stats.db_calls}")
+        lines.append(f"lunabot_handler_db_round_trips_count{{{_labels(stats)}}} {stats.count}")
+
+    lines += [
+        "# HELP lunabot_handler_db_seconds_total Time handlers spent waiting on Mongo",
+        "# TYPE lunabot_handler_db_seconds_total counter",
+    ]
+    for stats in HANDLER_STATS.values():
+        lines.append(f"lunabot_handler_db_seconds_total{{{_labels(stats)}}} {stats.db_time:.6f}")
+
+    lines += [
+        "# HELP lunabot_mongo_command_seconds Mongo command latency",
+        "# TYPE lunabot_mongo_command_seconds histogram",
+    ]
+    for command in list(COMMAND_STATS.values()):
+        labels = f'command="{command.command}",collection="{command.collection}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), command.buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f'lunabot_mongo_command_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"lunabot_mongo_command_seconds_sum{{{labels}}} {command.total:.6f}")
+        lines.append(f"lunabot_mongo_command_seconds_count{{{labels}}} {command.count}")
+
+    lines += [
+        "# HELP lunabot_mongo_command_failures_total Failed Mongo commands",
+        "# TYPE lunabot_mongo_command_failures_total counter",
+    ]
+    for command in list(COMMAND_STATS.values()):
+        labels = f'command="{command.command}",collection="{command.collection}"'
+        lines.append(f"lunabot_mongo_command_failures_total{{{labels}}} {command.failures}")
+
+    for metric, kind, help_text in (
+        ("hits", "counter", "Read-through cache hits"),
+        ("misses", "counter", "Read-through cache misses that queried Mongo"),
+        ("coalesced", "counter", "Read-through cache misses served by an in-flight query"),
+        ("stale", "counter", "Expired cache entries served while Mongo was unavailable"),
+        ("evictions", "counter", "Read-through cache LRU evictions"),
+        ("size", "gauge", "Read-through cache entries"),
+    ):
+        name = f"lunabot_cache_{metric}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for cache in CACHES.values():
+            value = len(cache) if metric == "size" else getattr(cache, metric)
+            lines.append(f'{name}{{cache="{cache.name}"}} {value}')
+
+    lines += [
+        "# HELP lunabot_mongo_breaker_open Whether the Mongo circuit breaker is open",
+        "# TYPE lunabot_mongo_breaker_open gauge",
+        f"lunabot_mongo_breaker_open {int(mongo_breaker.state != 'closed')}",
+        "# HELP lunabot_mongo_breaker_trips_total Times the Mongo circuit breaker opened",
+        "# TYPE lunabot_mongo_breaker_trips_total counter",
+        f"lunabot_mongo_breaker_trips_total {mongo_breaker.trips}",
+    ]
+    return "\n".join(lines) + "\n"
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+_runner: Optional[web.AppRunner] = None
+
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Show per-handler latency percentiles (owner only)
+    """
+    OWNER_ID = [int(x) for x in os.getenv("OWNER_ID", "").split(",") if x.strip()]
+    if update.effective_user.id not in OWNER_ID:
+        await update.message.reply_text("❌ You don't have permission to use this command.")
+        return
+
+    ranked = sorted(HANDLER_STATS.values(), key=lambda s: s.percentile(0.95), reverse=True)[:15]
+    if not ranked:
+        await update.message.reply_text("📭 No handler calls recorded yet.")
+        return
+
+    lines = [f"{'handler':<26}{'calls':>7}{'err':>5}{'p50':>7}{'p95':>7}{'p99':>7}{'db/call':>8}"]
+    for stats in ranked:
+        name = f"{stats.plugin}.{stats.handler}"[:25]
+        lines.append(
+            f"{name:<26}{stats.count:>7}{stats.errors:>5}"
+            + "".join(f"{stats.percentile(q) * 1000:>5.0f}ms" for q in (0.5, 0.95, 0.99))
+            + f"{stats.db_calls / max(stats.count, 1):>8.1f}"
+        )
+    table = "\n".join(lines)
+    await update.message.reply_text(
+        f"⏱ *Handler latency* \\({updates_total} updates\\)\n```\n{table}\n```",
+        parse_mode="MarkdownV2"
+    )
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(CommandHandler("perf", perf_command))
+    app.add_handler(TypeHandler(Update, count_update), group=UPDATE_COUNTER_GROUP)
+
+async def startup(app: Application) -> None:
+    """
+    Start the Prometheus endpoint when METRICS_PORT is configured
+    """
+    global _runner
+    if not METRICS_PORT or _runner is not None:
+        return
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", metrics_endpoint)
+    _runner = web.AppRunner(web_app)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_LISTEN, int(METRICS_PORT)).start()
+
+async def shutdown(app: Application) -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Metrics",
+        "description": "Per-handler latency, error and Mongo metrics",
+        "version": "1.0.0",
+        "commands": [
+            "/perf - Handler latency percentiles (admin only)"
+        ]
+    }
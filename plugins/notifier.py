@@ -0,0 +1,176 @@
+"""
+Support Notifier for LunaBot
+Queues support-chat logs and error reports in the background and sends them
+as periodic digests, grouping identical errors by fingerprint, so a failing
+hot handler never floods the support chat or waits on Telegram
+"""
+
+import os
+import re
+import sys
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from telegram import Bot
+from telegram.error import BadRequest
+
+NOTIFY_INTERVAL = float(os.getenv("NOTIFY_INTERVAL", "10"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_MAX_MESSAGES = int(os.getenv("NOTIFY_MAX_MESSAGES", "10"))
+
+MESSAGE_LIMIT = 4000
+
+logger = logging.getLogger(__name__)
+
+def describe_exception(exc_info=None) -> Optional[dict]:
+    """
+    Identify the exception being handled: its type, the plugin and handler it
+    was caught in, the frame that raised it and a stable fingerprint of those
+    """
+    exc_type, exc, tb = exc_info or sys.exc_info()
+    if exc is None or tb is None:
+        return None
+
+    outer = tb.tb_frame
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    inner = tb.tb_frame
+
+    module = outer.f_globals.get("__name__", "")
+    plugin = module.split(".", 1)[1] if module.startswith("plugins.") else module
+    handler = outer.f_code.co_name
+    frame = f"{os.path.basename(inner.f_code.co_filename)}:{tb.tb_lineno} in {inner.f_code.co_name}"
+    digest = hashlib.sha1(f"{exc_type.__name__}|{plugin}|{handler}|{frame}".encode()).hexdigest()[:12]
+    return {
+        "fingerprint": digest,
+        "exc_type": exc_type.__name__,
+        "plugin": plugin,
+        "handler": handler,
+        "frame": frame
+    }
+
+def fingerprint_text(text: str) -> str:
+    # Numbers (ids, timestamps, addresses) vary between otherwise identical reports
+    normalized = re.sub(r"0x[0-9a-fA-F]+|\d+", "#", text)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+class SupportNotifier:
+    def __init__(self, bot: Bot, chat_id, interval: float = NOTIFY_INTERVAL, queue_size: int = NOTIFY_QUEUE_SIZE):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._worker: Optional[asyncio.Task] = None
+        # Taken off the queue but not sent yet, and the digest being sent
+        self._batch: List[dict] = []
+        self._sending: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _submit(self, item: dict) -> None:
+        if not self.chat_id:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def log(self, text: str) -> None:
+        """
+        Queue a log line for the next digest; never blocks
+        """
+        self._submit({"kind": "log", "text": text})
+
+    def error(self, text: str, fingerprint: Optional[str] = None) -> None:
+        """
+        Queue an error report; reports sharing a fingerprint are sent once with a count
+        """
+        self._submit({"kind": "error", "text": text, "fingerprint": fingerprint or fingerprint_text(text)})
+
+    def _drain(self) -> List[dict]:
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _run(self) -> None:
+        while True:
+            self._batch.append(await self.queue.get())
+            # Let a window of events pile up so repeats collapse into one message
+            await asyncio.sleep(self.interval)
+            items, self._batch = self._batch + self._drain(), []
+            # Shielded so flush() can stop the worker without cutting a digest short
+            self._sending = asyncio.ensure_future(self._send_digest(items))
+            await asyncio.shield(self._sending)
+
+    def _build_messages(self, items: List[dict]) -> List[str]:
+        messages = []
+        chunk = ""
+        for item in items:
+            if item["kind"] != "log":
+                continue
+            text = item["text"][:MESSAGE_LIMIT]
+            if chunk and len(chunk) + len(text) + 2 > MESSAGE_LIMIT:
+                messages.append(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n\n{text}" if chunk else text
+        if chunk:
+            messages.append(chunk)
+
+        errors: Dict[str, dict] = {}
+        for item in items:
+            if item["kind"] == "error":
+                group = errors.setdefault(item["fingerprint"], {"text": item["text"], "count": 0})
+                group["count"] += 1
+        for fingerprint, group in errors.items():
+            header = ""
+            if group["count"] > 1:
+                header = f"🔁 *{group['count']}× in {int(self.interval)}s* `{fingerprint}`\n"
+            messages.append(header + group["text"])
+
+        if len(messages) > NOTIFY_MAX_MESSAGES:
+            extra = len(messages) - NOTIFY_MAX_MESSAGES + 1
+            messages = messages[:NOTIFY_MAX_MESSAGES - 1]
+            messages.append(f"➕ {extra} more notifications suppressed in this digest")
+        if self.dropped:
+            messages.append(f"⚠️ {self.dropped} notifications dropped, queue full")
+            self.dropped = 0
+        return messages
+
+    async def _send(self, text: str) -> None:
+        try:
+            await self.bot.send_message(chat_id=self.chat_id, text=text[:MESSAGE_LIMIT], parse_mode="MarkdownV2")
+        except BadRequest:
+            # Reports often carry unescaped exception text; plain text still gets them through
+            await self.bot.send_message(chat_id=self.chat_id, text=text[:MESSAGE_LIMIT])
+
+    async def _send_digest(self, items: List[dict]) -> None:
+        for text in self._build_messages(items):
+            try:
+                await self._send(text)
+            except Exception as e:
+                logger.error(f"Support notification failed: {e}")
+
+    async def flush(self) -> None:
+        """
+        Send everything still queued now, e.g. on shutdown
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._sending is not None:
+            await self._sending
+            self._sending = None
+        items, self._batch = self._batch + self._drain(), []
+        if items or self.dropped:
+            await self._send_digest(items)
@@ -0,0 +1,178 @@
+"""
+Outbound Scheduler for LunaBot
+Central rate limiter for every Bot API call the application makes. Plugged
+into ApplicationBuilder.rate_limiter, so plugins keep calling reply_text /
+edit_text as before and still respect Telegram's flood limits.
+"""
+
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Telegram's documented limits: ~30 messages/s overall, ~1/s per private
+# chat and 20/min per group
+GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+PRIVATE_CHAT_RATE = float(os.getenv("OUTBOUND_PRIVATE_CHAT_RATE", "1"))
+GROUP_CHAT_RATE = float(os.getenv("OUTBOUND_GROUP_CHAT_RATE", str(20 / 60)))
+GROUP_CHAT_BURST = int(os.getenv("OUTBOUND_GROUP_CHAT_BURST", "5"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Idle per-chat buckets are dropped after this many seconds
+BUCKET_IDLE_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            await asyncio.sleep(wait)
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """
+    Token buckets for the global and per-chat limits, RetryAfter-aware retries
+    and coalescing of edits to the same message. A superseded edit is never
+    sent; its caller waits for the newest edit and gets that edit's result,
+    so code that uses the returned Message still gets one.
+
+    rate_limit_args, when given, overrides the number of RetryAfter retries.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+        # Per edited message: the newest edit's seq and result future, and
+        # how many calls for the message are in flight
+        self._edits: Dict[tuple, dict] = {}
+        self._edit_seq = 0
+        self.dropped_edits = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self.chat_buckets.clear()
+        self._edits.clear()
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self._evict_idle()
+            # Private chats have positive ids, groups and channels negative
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, 1)
+            else:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - BUCKET_IDLE_SECONDS
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.updated < cutoff]:
+            del self.chat_buckets[chat_id]
+
+    @staticmethod
+    def _edit_key(endpoint: str, data: Dict[str, Any]) -> Optional[tuple]:
+        if not endpoint.startswith("editMessage"):
+            return None
+        if data.get("inline_message_id"):
+            return (endpoint, data["inline_message_id"])
+        if data.get("message_id") is not None:
+            return (endpoint, data.get("chat_id"), data["message_id"])
+        return None
+
+    def _superseded(self, edit_key: Optional[tuple], seq: int) -> bool:
+        return edit_key is not None and self._edits[edit_key]["seq"] != seq
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        # Only calls that post into a chat count against the flood limits
+        limited = chat_id is not None and (
+            endpoint.startswith(("send", "edit")) or endpoint in ("forwardMessage", "copyMessage")
+        )
+        if not limited:
+            return await callback(*args, **kwargs)
+
+        edit_key = self._edit_key(endpoint, data)
+        if edit_key is None:
+            return await self._send(callback, args, kwargs, endpoint, chat_id, rate_limit_args)
+
+        self._edit_seq += 1
+        seq = self._edit_seq
+        done = asyncio.get_running_loop().create_future()
+        slot = self._edits.setdefault(edit_key, {"calls": 0})
+        slot.update(seq=seq, future=done)
+        slot["calls"] += 1
+        try:
+            result = await self._send(callback, args, kwargs, endpoint, chat_id, rate_limit_args, edit_key, seq)
+        except BaseException as e:
+            done.set_exception(e)
+            done.exception()  # waiters get it; don't log it as unretrieved
+            raise
+        else:
+            done.set_result(result)
+            return result
+        finally:
+            slot["calls"] -= 1
+            if not slot["calls"]:
+                del self._edits[edit_key]
+
+    async def _send(self, callback, args: Any, kwargs: Dict[str, Any], endpoint: str, chat_id: Any,
+                    rate_limit_args: Optional[int], edit_key: Optional[tuple] = None, seq: int = 0):
+        chat_bucket = self._chat_bucket(chat_id)
+        max_retries = OUTBOUND_MAX_RETRIES if rate_limit_args is None else rate_limit_args
+        for attempt in range(max_retries + 1):
+            await chat_bucket.acquire()
+            if self._superseded(edit_key, seq):
+                # A newer edit of this message carries the final text; answer with its result
+                chat_bucket.refund()
+                self.dropped_edits += 1
+                return await asyncio.shield(self._edits[edit_key]["future"])
+            await self.global_bucket.acquire()
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                logger.warning(
+                    f"Flood limit on {endpoint} for chat {chat_id}: retry after {retry_after}s "
+                    f"(attempt {attempt + 1}/{max_retries + 1})"
+                )
+                chat_bucket.block(retry_after)
+                if attempt == max_retries:
+                    raise
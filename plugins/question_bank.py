@@ -0,0 +1,446 @@
+"""
+Question Bank Plugin for LunaBot
+Trivia questions, riddles and words imported from JSON/CSV datasets into
+Mongo. Every question gets dense 1..N sequence numbers per kind, per
+category and per difficulty, so a random draw is one indexed find_one on a
+random number instead of a $sample scan, however large the bank grows.
+
+Rows that fail to insert have their numbers compacted away. Only a crash
+mid-batch (or a concurrent import in another process) can leave gaps in a
+sequence; draws simply retry.
+"""
+
+import os
+import re
+import csv
+import json
+import random
+import asyncio
+import hashlib
+import logging
+import tempfile
+import traceback
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+from .db import db, counters_collection, reserve_sequence, release_sequence, send_error_to_support
+from .cache import ReadThroughCache
+from .breaker import STORAGE_ERRORS, mongo_breaker
+
+bank_collection = db["question_bank"]
+
+KINDS = ("trivia", "riddle", "word")
+DIFFICULTIES = ("easy", "medium", "hard")
+
+BANK_IMPORT_BATCH = int(os.getenv("BANK_IMPORT_BATCH", "1000"))
+# Bucket sizes are read from the counters; new imports show up within this long
+BANK_SIZE_TTL = float(os.getenv("BANK_SIZE_TTL", "60"))
+# Each chat avoids its last BANK_NO_REPEAT draws per bucket (at most half the bucket)
+BANK_NO_REPEAT = int(os.getenv("BANK_NO_REPEAT", "200"))
+BANK_WINDOW_CHATS = int(os.getenv("BANK_WINDOW_CHATS", "5000"))
+BANK_DRAW_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "question_bank": [
+        IndexModel([("kind", 1), ("gseq", 1)], unique=True),
+        IndexModel([("kind", 1), ("category", 1), ("cseq", 1)], unique=True),
+        IndexModel([("kind", 1), ("difficulty", 1), ("dseq", 1)], unique=True),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "question_bank": [
+        {"filter": {"kind": "trivia", "gseq": 0}},
+        {"filter": {"kind": "trivia", "category": "", "cseq": 0}},
+        {"filter": {"kind": "trivia", "difficulty": "", "dseq": 0}},
+    ]
+}
+
+bank_sizes = ReadThroughCache("question_bank_sizes", BANK_SIZE_TTL, max_size=10000)
+_import_lock = asyncio.Lock()
+
+def category_key(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", str(name).lower()).strip("_")
+
+def _counter_name(kind: str, field: str, value: Optional[str] = None) -> str:
+    if field == "cseq":
+        return f"bank:{kind}:c:{value}"
+    if field == "dseq":
+        return f"bank:{kind}:d:{value}"
+    return f"bank:{kind}"
+
+def _question_id(kind: str, text: str) -> str:
+    # Content hash, so re-importing a dataset skips what is already there
+    return hashlib.sha1(f"{kind}\0{text.strip().lower()}".encode()).hexdigest()[:24]
+
+def _parse_options(row: dict) -> List[str]:
+    options = row.get("options")
+    if isinstance(options, str):
+        options = options.split("|")
+    if not options:
+        options = [row.get(key) for key in ("option_a", "option_b", "option_c", "option_d", "option_e", "option_f")]
+        if not any(options):
+            options = [row.get(key) for key in ("a", "b", "c", "d", "e", "f")]
+    return [str(option).strip() for option in options if option not in (None, "") and str(option).strip()]
+
+def _parse_correct(value, options: List[str]) -> Optional[int]:
+    """
+    0-based index, a letter (A-F) or the text of the right option
+    """
+    if isinstance(value, int):
+        index = value
+    else:
+        text = str(value or "").strip()
+        lowered = [option.lower() for option in options]
+        if text.isdigit():
+            index = int(text)
+        elif text.lower() in lowered:
+            index = lowered.index(text.lower())
+        elif len(text) == 1 and text.isalpha():
+            index = ord(text.upper()) - 65
+        else:
+            index = -1
+    return index if 0 <= index < len(options) else None
+
+def parse_row(row: dict, default_kind: str = "trivia") -> Optional[dict]:
+    """
+    Turn one dataset row into a bank document, or None if it is unusable
+    """
+    row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    kind = str(row.get("kind") or row.get("type") or default_kind).strip().lower()
+    category = str(row.get("category") or "General").strip()
+    difficulty = str(row.get("difficulty") or "medium").strip().lower()
+    if difficulty not in DIFFICULTIES:
+        difficulty = "medium"
+
+    if kind == "trivia":
+        question = str(row.get("question") or "").strip()
+        options = _parse_options(row)
+        if not question or not 2 <= len(options) <= 6:
+            return None
+        correct = _parse_correct(row.get("correct", row.get("answer")), options)
+        if correct is None:
+            return None
+        text, data = question, {"question": question, "options": options, "correct": correct, "category": category}
+    elif kind == "riddle":
+        riddle = str(row.get("riddle") or row.get("question") or "").strip()
+        answer = str(row.get("answer") or "").strip()
+        if not riddle or not answer:
+            return None
+        text, data = riddle, {"riddle": riddle, "answer": answer, "hint": str(row.get("hint") or "No hint for this one").strip()}
+    elif kind == "word":
+        word = str(row.get("word") or "").strip().upper()
+        if len(word) < 3 or not word.isalpha():
+            return None
+        text, data = word, {"word": word, "hint": str(row.get("hint") or "No hint for this one").strip(), "category": category}
+    else:
+        return None
+
+    return {
+        "_id": _question_id(kind, text),
+        "kind": kind,
+        "category": category_key(category),
+        "difficulty": difficulty,
+        "data": data
+    }
+
+def _read_rows(f, path: str) -> Iterator[Optional[dict]]:
+    """
+    Rows of a CSV file (by extension), a JSON array, or JSON lines.
+    JSON lines and CSV are streamed; a JSON array is loaded whole.
+    """
+    if path.lower().endswith(".csv"):
+        yield from csv.DictReader(f)
+        return
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    if first == "[":
+        yield from json.loads(first + f.read())
+        return
+    for number, line in enumerate(f, 1):
+        line = (first + line) if number == 1 else line
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+async def _import_batch(rows: List[Optional[dict]], default_kind: str, report: dict) -> None:
+    documents = {}
+    for row in rows:
+        document = parse_row(row, default_kind) if isinstance(row, dict) else None
+        if document is None:
+            report["invalid"] += 1
+        elif document["_id"] in documents:
+            report["duplicates"] += 1
+        else:
+            documents[document["_id"]] = document
+    if not documents:
+        return
+
+    existing = {
+        document["_id"]
+        async for document in bank_collection.find({"_id": {"$in": list(documents)}}, {"_id": 1})
+    }
+    report["duplicates"] += len(existing)
+    new = [document for _id, document in documents.items() if _id not in existing]
+    if not new:
+        return
+
+    # One counter update per bucket reserves a dense block for the whole batch
+    buckets = {}
+    for document in new:
+        for field, value in (("gseq", None), ("cseq", document["category"]), ("dseq", document["difficulty"])):
+            buckets.setdefault((field, _counter_name(document["kind"], field, value)), []).append(document)
+    firsts = {}
+    for (field, name), members in buckets.items():
+        first = firsts[name] = await reserve_sequence(name, len(members))
+        for offset, document in enumerate(members):
+            document[field] = first + offset
+
+    try:
+        await bank_collection.insert_many(new, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details["writeErrors"]}
+        # 11000: imported since the existence check, e.g. by another process
+        report["duplicates"] += sum(1 for error in e.details["writeErrors"] if error.get("code") == 11000)
+        report["invalid"] += sum(1 for error in e.details["writeErrors"] if error.get("code") != 11000)
+        inserted = {document["_id"] for index, document in enumerate(new) if index not in failed}
+        await _compact_sequences(buckets, firsts, inserted)
+        report["imported"] += len(inserted)
+        return
+    report["imported"] += len(new)
+
+async def _compact_sequences(buckets: Dict[tuple, List[dict]], firsts: Dict[str, int], inserted: set) -> None:
+    """
+    Close the holes the rows that failed to insert left in each reserved
+    block: the block's highest-numbered rows move into the holes and the
+    unused numbers go back to the counter
+    """
+    moves, releases = [], []
+    for (field, name), members in buckets.items():
+        kept = [document for document in members if document["_id"] in inserted]
+        unused = len(members) - len(kept)
+        if not unused:
+            continue
+        end = firsts[name] + len(kept)
+        holes = sorted(document[field] for document in members
+                       if document["_id"] not in inserted and document[field] < end)
+        movers = [document for document in kept if document[field] >= end]
+        for document, seq in zip(movers, holes):
+            document[field] = seq
+            moves.append(UpdateOne({"_id": document["_id"]}, {"$set": {field: seq}}))
+        releases.append((name, firsts[name] + len(members) - 1, unused))
+    # Rows move before the counter shrinks, so a draw never lands past the rows
+    if moves:
+        await bank_collection.bulk_write(moves, ordered=False)
+    for name, last, unused in releases:
+        if not await release_sequence(name, last, unused):
+            logger.warning(f"Question bank counter {name} moved on during an import; {unused} numbers stay unused")
+
+async def import_questions(path: str, default_kind: str = "trivia") -> dict:
+    """
+    Stream a dataset into the bank in batches of BANK_IMPORT_BATCH, skipping
+    questions already imported. Imports run one at a time.
+    """
+    report = {"imported": 0, "duplicates": 0, "invalid": 0}
+    async with _import_lock:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = _read_rows(f, path)
+            while True:
+                # File reading and parsing stay off the event loop
+                batch = await asyncio.to_thread(lambda: list(islice(rows, BANK_IMPORT_BATCH)))
+                if not batch:
+                    break
+                await _import_batch(batch, default_kind, report)
+    bank_sizes.clear()
+    return report
+
+class RecentDraws:
+    """
+    Ring of a chat's last draws from one bucket, with counts for O(1) lookups
+    """
+
+    def __init__(self, capacity: int):
+        self.ring = deque(maxlen=capacity)
+        self.counts = {}
+
+    def add(self, seq: int) -> None:
+        if len(self.ring) == self.ring.maxlen:
+            oldest = self.ring[0]
+            self.counts[oldest] -= 1
+            if not self.counts[oldest]:
+                del self.counts[oldest]
+        self.ring.append(seq)
+        self.counts[seq] = self.counts.get(seq, 0) + 1
+
+    def pick(self, size: int) -> int:
+        # Never exclude more than half the bucket, so small buckets stay random
+        window = min(len(self.ring), size // 2)
+        if window == len(self.ring):
+            recent = self.counts
+        else:
+            recent = set(list(self.ring)[len(self.ring) - window:]) if window else ()
+        for _ in range(8):
+            seq = random.randint(1, size)
+            if seq not in recent:
+                break
+        return seq
+
+_recent: "OrderedDict[Tuple[int, str], RecentDraws]" = OrderedDict()
+
+def _recent_draws(chat_id: int, bucket: str) -> RecentDraws:
+    key = (chat_id, bucket)
+    recent = _recent.get(key)
+    if recent is None:
+        recent = _recent[key] = RecentDraws(BANK_NO_REPEAT)
+        while len(_recent) > BANK_WINDOW_CHATS:
+            _recent.popitem(last=False)
+    else:
+        _recent.move_to_end(key)
+    return recent
+
+async def bucket_size(name: str) -> int:
+    counter = await bank_sizes.get(
+        name, lambda: mongo_breaker.call(lambda: counters_collection.find_one({"_id": name}))
+    )
+    return counter["seq"] if counter else 0
+
+async def list_categories(kind: str) -> List[Tuple[str, int]]:
+    """
+    (category, size) pairs of a kind, largest first
+    """
+    prefix = _counter_name(kind, "cseq", "")
+    counters = await bank_sizes.get(
+        ("categories", kind),
+        lambda: mongo_breaker.call(
+            lambda: counters_collection.find({"_id": {"$regex": f"^{re.escape(prefix)}"}}).to_list(length=None)
+        )
+    )
+    return sorted(((c["_id"][len(prefix):], c["seq"]) for c in counters), key=lambda item: -item[1])
+
+async def draw_question(kind: str, chat_id: int, category: Optional[str] = None,
+                        difficulty: Optional[str] = None) -> Optional[dict]:
+    """
+    A random bank document of the kind, optionally of one category or one
+    difficulty, avoiding the chat's recent draws. None if the bucket is
+    empty or Mongo is unavailable, so callers fall back to built-in lists.
+    """
+    if category:
+        field, value = "cseq", category_key(category)
+        query = {"kind": kind, "category": value}
+    elif difficulty:
+        field, value = "dseq", difficulty
+        query = {"kind": kind, "difficulty": value}
+    else:
+        field, value = "gseq", None
+        query = {"kind": kind}
+    bucket = _counter_name(kind, field, value)
+
+    try:
+        size = await bucket_size(bucket)
+        if not size:
+            return None
+        recent = _recent_draws(chat_id, bucket)
+        for _ in range(BANK_DRAW_ATTEMPTS):
+            seq = recent.pick(size)
+            document = await mongo_breaker.call(lambda: bank_collection.find_one({**query, field: seq}))
+            if document is not None:
+                recent.add(seq)
+                return document
+    except STORAGE_ERRORS:
+        pass
+    return None
+
+async def _run_import(context: ContextTypes.DEFAULT_TYPE, chat_id: int, path: str, kind: str, cleanup: bool) -> None:
+    try:
+        report = await import_questions(path, kind)
+        await context.bot.send_message(
+            chat_id,
+            f"✅ Question import finished\n"
+            f"Imported: {report['imported']}\n"
+            f"Already in the bank: {report['duplicates']}\n"
+            f"Invalid rows: {report['invalid']}"
+        )
+    except Exception as e:
+        await context.bot.send_message(chat_id, f"❌ Question import failed: {e}")
+        await send_error_to_support(f"*❌ Question Import Error:*\n`{str(e)}`\n```{traceback.format_exc()}```")
+    finally:
+        if cleanup:
+            os.remove(path)
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Import questions (owner only): reply to a .jsonl/.json/.csv file, or
+    give a path on the server for files too big to upload.
+    /importquestions [trivia|riddle|word] [path]
+    """
+    try:
+        OWNER_ID = [int(x) for x in os.getenv("OWNER_ID", "").split(",") if x.strip()]
+        if update.effective_user.id not in OWNER_ID:
+            await update.message.reply_text("❌ You don't have permission to use this command.")
+            return
+
+        args = list(context.args or [])
+        kind = args.pop(0).lower() if args and args[0].lower() in KINDS else "trivia"
+        reply = update.message.reply_to_message
+
+        if reply and reply.document:
+            suffix = os.path.splitext(reply.document.file_name or "")[1] or ".jsonl"
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+            await (await reply.document.get_file()).download_to_drive(path)
+            cleanup = True
+        elif args:
+            path = " ".join(args)
+            if not os.path.isfile(path):
+                await update.message.reply_text(f"❌ File not found: {path}")
+                return
+            cleanup = False
+        else:
+            await update.message.reply_text(
+                "Reply to a .jsonl, .json or .csv file, or pass a server path:\n"
+                "/importquestions [trivia|riddle|word] [path]"
+            )
+            return
+
+        # Large datasets take minutes; don't hold up other updates meanwhile
+        context.application.create_task(_run_import(context, update.effective_chat.id, path, kind, cleanup))
+        await update.message.reply_text(f"⏳ Importing {kind} questions, I'll report back when done.")
+    except Exception as e:
+        await send_error_to_support(f"*❌ Import Command Error:*\n`{str(e)}`\n```{traceback.format_exc()}```")
+
+def setup(app: Application) -> None:
+    """
+    Setup function called by the main bot to register handlers
+    """
+    app.add_handler(CommandHandler("importquestions", import_command))
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+def get_info() -> dict:
+    """
+    Return plugin information
+    """
+    return {
+        "name": "Question Bank",
+        "description": "Imported trivia, riddles and words with constant-time random draws",
+        "version": "1.0.0",
+        "commands": [
+            "/importquestions [kind] [path] - Import a JSON/CSV question dataset (owner only)"
+        ]
+    }
@@ -1,30 +1,27 @@
 from datetime import datetime
 import traceback
-import os
-from telegram import Update, Bot
+from pymongo import IndexModel
+from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
-from plugins.db import db  # ✅ Corrected import
+from plugins.db import db, send_error_to_support as report_error  # ✅ Corrected import
+from plugins.journal import journaled_write
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-SUPPORT_CHAT_ID = os.getenv("SUPPORT_CHAT_ID")
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "samples": [IndexModel([("chat_id", 1), ("timestamp", -1)])]
+}
 
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "samples": [{"filter": {"chat_id": 0}, "sort": [("timestamp", -1)]}]
+}
 
 async def send_error_to_support(error: Exception, where="sample_plugin"):
-    if not BOT_TOKEN or not SUPPORT_CHAT_ID:
-        return
-    bot = Bot(BOT_TOKEN)
-    try:
-        await bot.send_message(
-            chat_id=SUPPORT_CHAT_ID,
-            text=(
-                f"❗️ *Plugin Error: {where}*\n"
-                f"`{str(error)}`\n\n"
-                f"```{traceback.format_exc()}```"
-            )[:4000],
-            parse_mode="MarkdownV2"
-        )
-    except Exception:
-        pass
+    await report_error(
+        f"❗️ *Plugin Error: {where}*\n"
+        f"`{str(error)}`\n\n"
+        f"```{traceback.format_exc()}```"
+    )
 
 
 # /sample command
@@ -43,7 +40,7 @@ async def sample_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "timestamp": datetime.utcnow()
         }
 
-        await db.samples.insert_one(data)
+        await journaled_write(db.samples, "insert_one", data)
 
         await message.reply_text(
             f"✅ Sample stored for *{user.first_name}*\\.\n📝 Message: `{data['message']}`",
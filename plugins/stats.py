@@ -0,0 +1,168 @@
+"""
+Stats helpers for LunaBot
+Keeps running user totals, per-day signup buckets and a top-N active users
+list up to date from the user_management and activity write paths, so
+/userstats is a constant-time read
+"""
+
+import os
+from datetime import datetime, timedelta
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from .db import db, counters_collection, get_collection
+
+# Collections
+stats_collection = get_collection("stats", write_concern="fast")
+users_collection = get_collection("users")
+
+TOP_USERS_ID = "top_users"
+TOP_USERS_LIMIT = int(os.getenv("TOP_USERS_LIMIT", "5"))
+SIGNUP_BUCKET_DAYS = int(os.getenv("SIGNUP_BUCKET_DAYS", "90"))
+
+# Indexes reconciled by the plugin loader at boot. Only signup buckets carry
+# a "day" field, so the TTL never touches the top users document.
+INDEXES = {
+    "stats": [
+        IndexModel([("day", 1)], expireAfterSeconds=SIGNUP_BUCKET_DAYS * 86400),
+    ]
+}
+
+# Lowest interaction count on the top users list and who is on it. Users below
+# the floor cannot enter the list, so their interactions cost no stats write.
+_top_floor = 0
+_top_ids = set()
+
+def _day_start(when: datetime) -> datetime:
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _signup_key(day: datetime) -> str:
+    return f"signups:{day.strftime('%Y-%m-%d')}"
+
+def _remember_top(users: list) -> None:
+    global _top_floor, _top_ids
+    _top_ids = {entry["user_id"] for entry in users}
+    _top_floor = users[-1].get("interaction_count", 0) if len(users) >= TOP_USERS_LIMIT else 0
+
+async def record_signup(when: datetime) -> None:
+    """
+    Count a new user in the signup bucket for its day
+    """
+    day = _day_start(when)
+    await stats_collection.update_one(
+        {"_id": _signup_key(day)},
+        {"$inc": {"count": 1}, "$setOnInsert": {"day": day}},
+        upsert=True
+    )
+
+async def record_interaction(user_doc: dict) -> None:
+    """
+    Move a user into the top active users list if their new count earns it.
+    user_doc needs user_id, first_name, username and interaction_count.
+    """
+    user_id = user_doc["user_id"]
+    count = user_doc.get("interaction_count", 0)
+    if count < _top_floor and user_id not in _top_ids:
+        return
+
+    entry = {
+        "user_id": user_id,
+        "first_name": user_doc.get("first_name"),
+        "username": user_doc.get("username"),
+        "interaction_count": count
+    }
+    await stats_collection.update_one(
+        {"_id": TOP_USERS_ID},
+        {"$pull": {"users": {"user_id": user_id}}}
+    )
+    try:
+        top = await stats_collection.find_one_and_update(
+            {"_id": TOP_USERS_ID, "users.user_id": {"$ne": user_id}},
+            {
+                "$push": {
+                    "users": {
+                        "$each": [entry],
+                        "$sort": {"interaction_count": -1},
+                        "$slice": TOP_USERS_LIMIT
+                    }
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another writer re-added this user between our $pull and $push
+        return
+    _remember_top(top["users"])
+
+async def record_activity(user_ids) -> None:
+    """
+    Offer users whose counts were just bumped to the top users list. Only
+    users at or above the current floor are read back, so this is one
+    indexed query per activity flush.
+    """
+    cursor = users_collection.find(
+        {"user_id": {"$in": list(user_ids)}, "interaction_count": {"$gte": max(_top_floor, 1)}},
+        {"_id": 0, "user_id": 1, "first_name": 1, "username": 1, "interaction_count": 1}
+    )
+    async for user_doc in cursor:
+        await record_interaction(user_doc)
+
+async def refresh_top_users() -> list:
+    """
+    Rebuild the top users list from the interaction_count index
+    """
+    cursor = users_collection.find(
+        {"interaction_count": {"$gt": 0}},
+        {"_id": 0, "user_id": 1, "first_name": 1, "username": 1, "interaction_count": 1}
+    ).sort("interaction_count", -1).limit(TOP_USERS_LIMIT)
+    users = await cursor.to_list(length=TOP_USERS_LIMIT)
+    await stats_collection.update_one(
+        {"_id": TOP_USERS_ID},
+        {"$set": {"users": users}},
+        upsert=True
+    )
+    _remember_top(users)
+    return users
+
+async def get_snapshot() -> dict:
+    """
+    Read total users, today's signups and the top users list in constant time
+    """
+    today_key = _signup_key(_day_start(datetime.utcnow()))
+    docs = {}
+    async for doc in stats_collection.find({"_id": {"$in": [today_key, TOP_USERS_ID]}}):
+        docs[doc["_id"]] = doc
+    counter = await counters_collection.find_one({"_id": "users"})
+
+    return {
+        "total_users": counter["seq"] if counter else 0,
+        "new_today": docs.get(today_key, {}).get("count", 0),
+        "top_users": docs.get(TOP_USERS_ID, {}).get("users", [])
+    }
+
+async def test() -> None:
+    """
+    Test function to verify the plugin works correctly
+    """
+    await db.command("ping")
+
+async def startup(app) -> None:
+    """
+    Backfill today's bucket and the top users list on first run
+    """
+    today = _day_start(datetime.utcnow())
+    if not await stats_collection.find_one({"_id": _signup_key(today)}, {"_id": 1}):
+        new_today = await users_collection.count_documents(
+            {"first_seen": {"$gte": today, "$lt": today + timedelta(days=1)}}
+        )
+        await stats_collection.update_one(
+            {"_id": _signup_key(today)},
+            {"$setOnInsert": {"count": new_today, "day": today}},
+            upsert=True
+        )
+
+    top = await stats_collection.find_one({"_id": TOP_USERS_ID})
+    if top is None:
+        await refresh_top_users()
+    else:
+        _remember_top(top.get("users", []))
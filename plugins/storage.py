@@ -0,0 +1,818 @@
+"""
+In-Memory Storage Backend for LunaBot
+A Motor-compatible client that keeps collections in process memory, for
+benchmarks, local test runs and small clone bots that have no MongoDB.
+Selected in plugins/db.py with STORAGE_BACKEND=memory.
+
+It covers the subset of the Motor API the plugins use: find_one/find with
+projection, sort, skip and limit, insert, update/replace/delete, upserts,
+find_one_and_update, bulk_write, count_documents, a small aggregate()
+and the common query and update operators. Unique indexes (sparse and
+partial ones included) are enforced and raise DuplicateKeyError or
+BulkWriteError the way pymongo does; other indexes are only recorded. With
+STORAGE_PATH set, data is loaded from and saved back to a BSON snapshot at
+exit.
+"""
+
+import os
+import re
+import copy
+import random
+import atexit
+import logging
+import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import bson
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# ----------- Field paths -----------
+def _resolve(value: Any, parts: List[str]) -> List[Any]:
+    """
+    Every value a dotted path reaches, descending into arrays like Mongo does
+    """
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        if parts[0] in value:
+            return _resolve(value[parts[0]], parts[1:])
+        return [_MISSING]
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return _resolve(value[index], parts[1:]) if index < len(value) else [_MISSING]
+        found = []
+        for item in value:
+            if isinstance(item, (dict, list)):
+                found.extend(v for v in _resolve(item, parts) if v is not _MISSING)
+        return found or [_MISSING]
+    return [_MISSING]
+
+def _candidates(doc: dict, path: str) -> List[Any]:
+    # A filter on an array field matches the array itself or any element
+    values = []
+    for value in _resolve(doc, path.split(".")):
+        values.append(value)
+        if isinstance(value, list):
+            values.extend(value)
+    return values
+
+def _get_path(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+def _set_path(doc: dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+def _unset_path(doc: dict, path: str) -> None:
+    parts = path.split(".")
+    target = _get_path(doc, ".".join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+# ----------- Ordering -----------
+def _type_rank(value: Any) -> int:
+    if value is _MISSING or value is None:
+        return 0
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    if isinstance(value, datetime.datetime):
+        return 7
+    return 8
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    rank = _type_rank(value)
+    if rank in (0, 3, 4, 8):
+        return (rank, repr(value) if rank else 0)
+    return (rank, value)
+
+def _compare(a: Any, b: Any) -> Optional[int]:
+    # Mongo only orders values of the same type bracket
+    if _type_rank(a) != _type_rank(b) or a is _MISSING:
+        return None
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return None
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(field, order) for field, order in key_or_list]
+
+def _sort_documents(docs: List[Any], spec: List[Tuple[str, int]]) -> List[Any]:
+    docs = list(docs)
+    for field, order in reversed(spec):
+        docs.sort(
+            key=lambda doc: _sort_key(_get_path(doc, field) if isinstance(doc, dict) else doc),
+            reverse=order == -1
+        )
+    return docs
+
+# ----------- Queries -----------
+def _equals(value: Any, expected: Any) -> bool:
+    if value is _MISSING:
+        return expected is None
+    # Mongo keeps booleans and numbers apart: {"x": 1} does not match true
+    if isinstance(value, bool) != isinstance(expected, bool):
+        return False
+    return value == expected
+
+def _match_operator(values: List[Any], op: str, arg: Any, doc: dict, path: str) -> bool:
+    present = [v for v in values if v is not _MISSING]
+    if op == "$eq":
+        return any(_equals(v, arg) for v in values)
+    if op == "$ne":
+        return not any(_equals(v, arg) for v in values)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        for value in present:
+            result = _compare(value, arg)
+            if result is None:
+                continue
+            if (op == "$gt" and result > 0) or (op == "$gte" and result >= 0) \
+                    or (op == "$lt" and result < 0) or (op == "$lte" and result <= 0):
+                return True
+        return False
+    if op == "$in":
+        return any(_equals(v, option) for v in values for option in arg)
+    if op == "$nin":
+        return not any(_equals(v, option) for v in values for option in arg)
+    if op == "$exists":
+        return bool(present) == bool(arg)
+    if op == "$regex":
+        pattern = arg if hasattr(arg, "search") else re.compile(arg)
+        return any(isinstance(v, str) and pattern.search(v) for v in present)
+    if op == "$size":
+        return any(isinstance(v, list) and len(v) == arg for v in _resolve(doc, path.split(".")))
+    if op == "$elemMatch":
+        return any(
+            isinstance(v, list) and any(isinstance(item, dict) and match(item, arg) for item in v)
+            for v in _resolve(doc, path.split("."))
+        )
+    if op == "$not":
+        return not _match_condition(doc, path, arg)
+    raise OperationFailure(f"Unsupported query operator {op} in memory storage")
+
+def _is_operator_dict(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(k.startswith("$") for k in value)
+
+def _match_condition(doc: dict, path: str, condition: Any) -> bool:
+    values = _candidates(doc, path)
+    if _is_operator_dict(condition):
+        return all(_match_operator(values, op, arg, doc, path) for op, arg in condition.items())
+    return any(_equals(v, condition) for v in values)
+
+def match(doc: dict, query: Optional[dict]) -> bool:
+    """
+    Whether a document satisfies a Mongo query filter
+    """
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(match(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(doc, key, condition):
+            return False
+    return True
+
+def _project(doc: dict, projection: Optional[Any]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result = {}
+        for field in fields:
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                _set_path(result, field, copy.deepcopy(value))
+    else:
+        result = copy.deepcopy(doc)
+        for field in fields:
+            _unset_path(result, field)
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+# ----------- Updates -----------
+def _apply_update(doc: dict, update: Any, inserting: bool) -> dict:
+    if isinstance(update, list):
+        raise OperationFailure("Pipeline updates are not supported by memory storage")
+    if not any(k.startswith("$") for k in update):
+        replacement = copy.deepcopy(update)
+        if "_id" in doc:
+            replacement["_id"] = doc["_id"]
+        return replacement
+
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current = _get_path(doc, path)
+            if op == "$set":
+                _set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                _set_path(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op == "$mul":
+                _set_path(doc, path, (0 if current is _MISSING else current) * arg)
+            elif op == "$min":
+                if current is _MISSING or (_compare(arg, current) or 0) < 0:
+                    _set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$max":
+                if current is _MISSING or (_compare(arg, current) or 0) > 0:
+                    _set_path(doc, path, copy.deepcopy(arg))
+            elif op in ("$push", "$addToSet"):
+                items = list(current) if isinstance(current, list) else []
+                modifiers = arg if _is_operator_dict(arg) and "$each" in arg else {"$each": [arg]}
+                for item in modifiers["$each"]:
+                    if op == "$push" or item not in items:
+                        items.append(copy.deepcopy(item))
+                if "$sort" in modifiers:
+                    sort = modifiers["$sort"]
+                    if isinstance(sort, dict):
+                        items = _sort_documents(items, _normalize_sort(sort))
+                    else:
+                        items.sort(key=_sort_key, reverse=sort == -1)
+                if "$slice" in modifiers:
+                    limit = modifiers["$slice"]
+                    items = items[:limit] if limit >= 0 else items[limit:]
+                _set_path(doc, path, items)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    if isinstance(arg, dict) and not _is_operator_dict(arg):
+                        kept = [item for item in current if not (isinstance(item, dict) and match(item, arg))]
+                    elif _is_operator_dict(arg):
+                        kept = [item for item in current if not _match_condition({"v": item}, "v", arg)]
+                    else:
+                        kept = [item for item in current if item != arg]
+                    _set_path(doc, path, kept)
+            elif op == "$currentDate":
+                _set_path(doc, path, datetime.datetime.utcnow())
+            else:
+                raise OperationFailure(f"Unsupported update operator {op} in memory storage")
+    return doc
+
+def _upsert_seed(query: dict) -> dict:
+    """
+    The equality fields of a filter, which an upsert copies into the new document
+    """
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            if key == "$and":
+                for sub in condition:
+                    seed.update(_upsert_seed(sub))
+            continue
+        if _is_operator_dict(condition):
+            if "$eq" in condition:
+                _set_path(seed, key, copy.deepcopy(condition["$eq"]))
+            continue
+        _set_path(seed, key, copy.deepcopy(condition))
+    return seed
+
+# ----------- Aggregation -----------
+def _expression(doc: dict, expr: Any) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    return expr
+
+def _group(docs: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, dict] = {}
+    for doc in docs:
+        key_expr = spec["_id"]
+        if isinstance(key_expr, dict):
+            key = {name: _expression(doc, expr) for name, expr in key_expr.items()}
+        else:
+            key = _expression(doc, key_expr)
+        marker = repr(key)
+        group = groups.get(marker)
+        if group is None:
+            group = groups[marker] = {"_id": key, "__n": 0}
+        group["__n"] += 1
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expr), = accumulator.items()
+            value = _expression(doc, expr)
+            if op == "$sum":
+                group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op == "$avg":
+                group.setdefault(f"__{field}", []).append(value)
+            elif op == "$min":
+                if field not in group or (value is not None and (_compare(value, group[field]) or 0) < 0):
+                    group[field] = value
+            elif op == "$max":
+                if field not in group or (value is not None and (_compare(value, group[field]) or 0) > 0):
+                    group[field] = value
+            elif op == "$first":
+                group.setdefault(field, value)
+            elif op == "$last":
+                group[field] = value
+            elif op == "$push":
+                group.setdefault(field, []).append(value)
+            elif op == "$addToSet":
+                items = group.setdefault(field, [])
+                if value not in items:
+                    items.append(value)
+            else:
+                raise OperationFailure(f"Unsupported accumulator {op} in memory storage")
+    results = []
+    for group in groups.values():
+        for field, accumulator in spec.items():
+            if field != "_id" and "$avg" in accumulator:
+                values = [v for v in group.pop(f"__{field}", []) if isinstance(v, (int, float))]
+                group[field] = sum(values) / len(values) if values else None
+        group.pop("__n")
+        results.append(group)
+    return results
+
+def _run_pipeline(docs: List[dict], pipeline: List[dict]) -> List[dict]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if match(doc, spec)]
+        elif name == "$group":
+            docs = _group(docs, spec)
+        elif name == "$sort":
+            docs = _sort_documents(docs, _normalize_sort(spec))
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$project":
+            docs = [_project(doc, spec) for doc in docs]
+        elif name == "$count":
+            docs = [{spec: len(docs)}]
+        elif name == "$sample":
+            docs = random.sample(docs, min(spec["size"], len(docs)))
+        else:
+            raise OperationFailure(f"Unsupported pipeline stage {name} in memory storage")
+    return docs
+
+# ----------- Cursors -----------
+class MemoryCursor:
+    """
+    Lazy result set supporting sort/skip/limit chaining, to_list and async for
+    """
+
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[Any] = None,
+                 sort: Optional[Any] = None, skip: int = 0, limit: int = 0):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = _normalize_sort(sort) if sort else []
+        self._skip = skip
+        self._limit = limit
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def _evaluate(self) -> List[dict]:
+        if self._results is None:
+            docs = [doc for doc in self.collection._docs.values() if match(doc, self.query)]
+            if self._sort:
+                docs = _sort_documents(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = [_project(doc, self.projection) for doc in docs]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._evaluate()
+        return results[:length] if length else list(results)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._evaluate():
+            yield doc
+
+    async def explain(self) -> dict:
+        return {"queryPlanner": {"winningPlan": {"stage": "MEMORY_SCAN"}}}
+
+class MemoryCommandCursor:
+    def __init__(self, results: List[dict]):
+        self._results = results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._results[:length] if length else list(self._results)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results:
+            yield doc
+
+# ----------- Collections -----------
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._indexes: Dict[str, dict] = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        # Unique index name -> index key -> _id key of the document holding it
+        self._unique: Dict[str, Dict[tuple, Any]] = {}
+
+    def with_options(self, **options) -> "MemoryCollection":
+        # Write concerns and read preferences mean nothing in process memory
+        return self
+
+    @staticmethod
+    def _id_key(value: Any) -> Any:
+        return repr(value) if isinstance(value, (dict, list)) else value
+
+    def _duplicate(self, index: str, key: Any) -> DuplicateKeyError:
+        message = f"E11000 duplicate key error collection: {self.name} index: {index} dup key: {key!r}"
+        return DuplicateKeyError(message, 11000, {"code": 11000, "errmsg": message})
+
+    def _index_key(self, spec: dict, doc: dict) -> Optional[tuple]:
+        """
+        The document's entry in an index, or None when the index skips it
+        """
+        partial = spec.get("partialFilterExpression")
+        if partial and not match(doc, partial):
+            return None
+        values = [_get_path(doc, field) for field, _ in spec["key"]]
+        if spec.get("sparse") and all(value is _MISSING for value in values):
+            return None
+        # A missing field is indexed as null, so two documents without it collide
+        return tuple(self._id_key(None if value is _MISSING else value) for value in values)
+
+    def _check_unique(self, doc: dict) -> None:
+        owner = self._id_key(doc["_id"])
+        for name, entries in self._unique.items():
+            key = self._index_key(self._indexes[name], doc)
+            if key is not None and entries.get(key, owner) != owner:
+                raise self._duplicate(name, key)
+
+    def _put(self, doc: dict, previous: Optional[dict] = None) -> None:
+        """
+        Store a document (replacing previous) and keep the unique indexes in step
+        """
+        self._check_unique(doc)
+        if previous is not None:
+            self._unindex(previous)
+        owner = self._id_key(doc["_id"])
+        for name, entries in self._unique.items():
+            key = self._index_key(self._indexes[name], doc)
+            if key is not None:
+                entries[key] = owner
+        self._docs[owner] = doc
+
+    def _unindex(self, doc: dict) -> None:
+        for name, entries in self._unique.items():
+            key = self._index_key(self._indexes[name], doc)
+            if key is not None:
+                entries.pop(key, None)
+
+    def _remove(self, doc: dict) -> None:
+        self._unindex(doc)
+        del self._docs[self._id_key(doc["_id"])]
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if self._id_key(document["_id"]) in self._docs:
+            raise self._duplicate("_id_", (document["_id"],))
+        self._put(copy.deepcopy(document))
+        return document["_id"]
+
+    def _matching(self, query: Optional[dict], sort: Optional[Any] = None) -> List[dict]:
+        if query and set(query) == {"_id"} and not _is_operator_dict(query["_id"]):
+            doc = self._docs.get(self._id_key(query["_id"]))
+            return [doc] if doc is not None else []
+        docs = [doc for doc in self._docs.values() if match(doc, query)]
+        return _sort_documents(docs, _normalize_sort(sort)) if sort else docs
+
+    def _update(self, query: dict, update: Any, upsert: bool, multi: bool, sort: Optional[Any] = None):
+        matched = self._matching(query, sort)
+        if not multi:
+            matched = matched[:1]
+        modified = 0
+        for doc in matched:
+            updated = _apply_update(copy.deepcopy(doc), update, inserting=False)
+            if updated.get("_id") != doc.get("_id"):
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            if updated != doc:
+                modified += 1
+            self._put(updated, previous=doc)
+        if matched or not upsert:
+            return matched, modified, None, None
+        new_doc = _apply_update(_upsert_seed(query), update, inserting=True)
+        upserted_id = self._insert(new_doc)
+        return [], 0, upserted_id, new_doc
+
+    async def find_one(self, filter: Any = None, projection: Optional[Any] = None, sort: Optional[Any] = None,
+                       *args, **kwargs) -> Optional[dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = self._matching(filter, sort)
+        return _project(docs[0], projection) if docs else None
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[Any] = None, sort: Optional[Any] = None,
+             skip: int = 0, limit: int = 0, *args, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection, sort, skip, limit)
+
+    async def insert_one(self, document: dict, *args, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, *args, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        # Duplicates surface as BulkWriteError, and ordered=False inserts the rest
+        await self.bulk_write([InsertOne(doc) for doc in documents], ordered=ordered)
+        return InsertManyResult([doc["_id"] for doc in documents], True)
+
+    async def update_one(self, filter: dict, update: Any, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, multi=False, sort=kwargs.get("sort"))
+        return UpdateResult(self._update_raw(matched, modified, upserted_id), True)
+
+    async def update_many(self, filter: dict, update: Any, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, multi=True)
+        return UpdateResult(self._update_raw(matched, modified, upserted_id), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        if any(key.startswith("$") for key in replacement):
+            raise ValueError("replacement can not include $ operators")
+        matched, modified, upserted_id, _ = self._update(filter, replacement, upsert, multi=False)
+        return UpdateResult(self._update_raw(matched, modified, upserted_id), True)
+
+    @staticmethod
+    def _update_raw(matched: List[dict], modified: int, upserted_id: Any) -> dict:
+        raw = {"n": len(matched) or (1 if upserted_id is not None else 0), "nModified": modified, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return raw
+
+    async def delete_one(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        docs = self._matching(filter)[:1]
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult({"n": len(docs), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        docs = self._matching(filter)
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult({"n": len(docs), "ok": 1.0}, True)
+
+    async def find_one_and_update(self, filter: dict, update: Any, projection: Optional[Any] = None,
+                                  sort: Optional[Any] = None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE, *args, **kwargs) -> Optional[dict]:
+        matched, _, _, inserted = self._update(filter, update, upsert, multi=False, sort=sort)
+        if matched:
+            before = matched[0]
+            if return_document == ReturnDocument.AFTER:
+                return _project(self._docs[self._id_key(before["_id"])], projection)
+            return _project(before, projection)
+        if inserted is not None and return_document == ReturnDocument.AFTER:
+            return _project(inserted, projection)
+        return None
+
+    async def find_one_and_delete(self, filter: dict, projection: Optional[Any] = None,
+                                  sort: Optional[Any] = None, *args, **kwargs) -> Optional[dict]:
+        docs = self._matching(filter, sort)[:1]
+        for doc in docs:
+            self._remove(doc)
+        return _project(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter: Optional[dict] = None, *args, **kwargs) -> int:
+        count = len(self._matching(filter or {}))
+        count = max(0, count - kwargs.get("skip", 0))
+        return min(count, kwargs["limit"]) if kwargs.get("limit") else count
+
+    async def estimated_document_count(self, *args, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, *args, **kwargs) -> List[Any]:
+        values = []
+        for doc in self._matching(filter or {}):
+            for value in _candidates(doc, key):
+                if value is not _MISSING and not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    def aggregate(self, pipeline: List[dict], *args, **kwargs) -> MemoryCommandCursor:
+        docs = [copy.deepcopy(doc) for doc in self._docs.values()]
+        return MemoryCommandCursor(_run_pipeline(docs, pipeline))
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, *args, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    matched, modified, upserted_id, _ = self._update(
+                        request._filter, request._doc, bool(request._upsert),
+                        multi=isinstance(request, UpdateMany)
+                    )
+                    result["nMatched"] += len(matched)
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    docs = self._matching(request._filter)
+                    if isinstance(request, DeleteOne):
+                        docs = docs[:1]
+                    for doc in docs:
+                        self._remove(doc)
+                    result["nRemoved"] += len(docs)
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except OperationFailure as e:
+                result["writeErrors"].append({"index": index, "code": e.code, "errmsg": str(e),
+                                              "op": getattr(request, "_doc", None)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            result["writeConcernErrors"] = []
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys: Any, **kwargs) -> str:
+        key = _normalize_sort(keys, 1)
+        name = kwargs.pop("name", None) or "_".join(f"{field}_{order}" for field, order in key)
+        spec = {"key": key, "v": 2, **kwargs}
+        if spec.get("unique") and name != "_id_":
+            # Like Mongo, refuse to build a unique index over existing duplicates
+            entries = {}
+            for owner, doc in self._docs.items():
+                index_key = self._index_key(spec, doc)
+                if index_key is None:
+                    continue
+                if index_key in entries:
+                    raise self._duplicate(name, index_key)
+                entries[index_key] = owner
+            self._unique[name] = entries
+        else:
+            self._unique.pop(name, None)
+        self._indexes[name] = spec
+        return name
+
+    async def create_indexes(self, indexes: List[Any], *args, **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            spec = dict(model.document)
+            names.append(await self.create_index(list(spec.pop("key").items()), **spec))
+        return names
+
+    async def index_information(self, *args, **kwargs) -> Dict[str, dict]:
+        return copy.deepcopy(self._indexes)
+
+    async def drop_index(self, index_or_name: Any, *args, **kwargs) -> None:
+        self._indexes.pop(index_or_name, None)
+        self._unique.pop(index_or_name, None)
+
+    async def drop(self, *args, **kwargs) -> None:
+        self.database._collections.pop(self.name, None)
+
+# ----------- Databases -----------
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, *args, **options) -> MemoryCollection:
+        return self[name]
+
+    async def command(self, command: Any, value: Any = 1, *args, **kwargs) -> dict:
+        name = next(iter(command)) if isinstance(command, dict) else command
+        if name in ("ping", "collMod", "serverStatus", "buildInfo", "hello", "isMaster"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"Command {name} is not supported by memory storage")
+
+    async def list_collection_names(self, *args, **kwargs) -> List[str]:
+        return [name for name, collection in self._collections.items() if collection._docs]
+
+    async def drop_collection(self, name: str, *args, **kwargs) -> None:
+        self._collections.pop(name, None)
+
+class MemoryClient:
+    """
+    Drop-in for AsyncIOMotorClient. With a path, the data survives restarts
+    through a BSON snapshot written at interpreter exit and on save().
+    """
+
+    def __init__(self, path: Optional[str] = STORAGE_PATH):
+        self.path = path
+        self._databases: Dict[str, MemoryDatabase] = {}
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name: str, *args, **options) -> MemoryDatabase:
+        return self[name]
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = bson.decode(f.read())
+        except FileNotFoundError:
+            return
+        for db_name, collections in snapshot.items():
+            database = self[db_name]
+            for name, documents in collections.items():
+                collection = database[name]
+                for document in documents:
+                    collection._insert(document)
+        logger.info(f"Loaded memory storage snapshot from {self.path}")
+
+    def save(self) -> None:
+        """
+        Write every collection to the snapshot file atomically
+        """
+        if not self.path:
+            return
+        snapshot = {
+            db_name: {name: list(collection._docs.values()) for name, collection in database._collections.items()}
+            for db_name, database in self._databases.items()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(bson.encode(snapshot))
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        self.save()
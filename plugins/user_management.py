@@ -4,15 +4,83 @@ Handles new user registration and tracking
 """
 
 import os
+import logging
 import traceback
 from datetime import datetime
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
-from .db import db, send_log, send_error_to_support
+from .db import db, send_log, send_error_to_support, next_sequence, seed_sequence
+from .breaker import STORAGE_ERRORS, mongo_breaker
+from .journal import journaled_write, on_replayed_upsert
+from . import stats
 
 # Collection for storing user data
 users_collection = db["users"]
 
+# Fields /start refreshes on every call; the rest are set once on insert
+PROFILE_FIELDS = ("last_seen", "username", "first_name", "last_name")
+
+logger = logging.getLogger(__name__)
+
+# Indexes reconciled by the plugin loader at boot
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("interaction_count", -1)]),
+        IndexModel([("first_seen", 1)]),
+    ]
+}
+
+# Query shapes the loader explains at boot to catch collection scans
+QUERIES = {
+    "users": [
+        {"filter": {"user_id": 0}},
+        {"filter": {"first_seen": {"$gte": datetime(1970, 1, 1)}}},
+        {"filter": {}, "sort": [("interaction_count", -1)]},
+    ]
+}
+
+async def record_signup(profile: dict, when: datetime) -> None:
+    """
+    Number a new user from the maintained counter, count the signup and
+    announce it in the support chat
+    """
+    total_users = await next_sequence("users")
+    await stats.record_signup(when)
+
+    user_info = f"👤 *New User #{total_users}*\n"
+    user_info += f"• *Name:* {profile.get('first_name') or 'N/A'}"
+    if profile.get("last_name"):
+        user_info += f" {profile['last_name']}"
+    user_info += f"\n• *Username:* @{profile.get('username') or 'N/A'}"
+    user_info += f"\n• *User ID:* `{profile['user_id']}`"
+    user_info += f"\n• *Language:* {profile.get('language_code') or 'N/A'}"
+    user_info += f"\n• *Chat Type:* {profile.get('chat_type')}"
+    user_info += f"\n• *Total Users:* {total_users}"
+
+    await send_log(user_info)
+
+async def signup_from_journal(record: dict) -> None:
+    """
+    Count the signup of a user created by a /start that was journaled while
+    Mongo was down. The user was created by that /start (on replay, or by
+    the attempt that timed out) if its first_seen is the one journaled; the
+    signup_counted flag keeps a repeated replay from counting it twice.
+    """
+    update = record["update"]
+    profile = {**record["filter"], **update.get("$set", {}), **update.get("$setOnInsert", {})}
+    if "first_seen" not in profile:
+        return
+    created = await users_collection.find_one_and_update(
+        {**record["filter"], "first_seen": profile["first_seen"], "signup_counted": {"$ne": True}},
+        {"$set": {"signup_counted": True}},
+        projection={"_id": 1}
+    )
+    if created is not None:
+        await record_signup(profile, profile["first_seen"])
+
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Enhanced start command that stores user data and tracks new users
@@ -20,58 +88,44 @@ async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     try:
         user = update.effective_user
         chat = update.effective_chat
+        now = datetime.utcnow()
         
-        # Prepare user data
-        user_data = {
-            "user_id": user.id,
-            "username": user.username,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "language_code": user.language_code,
-            "is_bot": user.is_bot,
-            "chat_id": chat.id,
-            "chat_type": chat.type,
-            "first_seen": datetime.utcnow(),
-            "last_seen": datetime.utcnow(),
-            "interaction_count": 1
+        # One atomic upsert registers or refreshes the user; the pre-image
+        # tells us whether this /start created the document
+        user_filter = {"user_id": user.id}
+        user_update = {
+            "$set": {
+                "last_seen": now,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name
+            },
+            "$setOnInsert": {
+                "language_code": user.language_code,
+                "is_bot": user.is_bot,
+                "chat_id": chat.id,
+                "chat_type": chat.type,
+                "first_seen": now
+            }
         }
-        
-        # Check if user already exists
-        existing_user = await users_collection.find_one({"user_id": user.id})
-        
-        if existing_user:
-            # Update existing user's last seen and increment interaction count
-            await users_collection.update_one(
-                {"user_id": user.id},
-                {
-                    "$set": {
-                        "last_seen": datetime.utcnow(),
-                        "username": user.username,
-                        "first_name": user.first_name,
-                        "last_name": user.last_name
-                    },
-                    "$inc": {"interaction_count": 1}
-                }
+        try:
+            existing_user = await mongo_breaker.call(lambda: users_collection.find_one_and_update(
+                user_filter, user_update, upsert=True, return_document=ReturnDocument.BEFORE
+            ))
+        except DuplicateKeyError:
+            # A concurrent /start inserted the user first; ours is just an update
+            existing_user = await users_collection.find_one_and_update(
+                user_filter, user_update, return_document=ReturnDocument.BEFORE
             )
-        else:
-            # New user - insert into database
-            await users_collection.insert_one(user_data)
-            
-            # Get total user count
-            total_users = await users_collection.count_documents({})
-            
-            # Send notification to support chat about new user
-            user_info = f"👤 *New User #{total_users}*\n"
-            user_info += f"• *Name:* {user.first_name or 'N/A'}"
-            if user.last_name:
-                user_info += f" {user.last_name}"
-            user_info += f"\n• *Username:* @{user.username or 'N/A'}"
-            user_info += f"\n• *User ID:* `{user.id}`"
-            user_info += f"\n• *Language:* {user.language_code or 'N/A'}"
-            user_info += f"\n• *Chat Type:* {chat.type}"
-            user_info += f"\n• *Total Users:* {total_users}"
-            
-            await send_log(user_info)
+        except STORAGE_ERRORS:
+            # Mongo is unavailable: keep the upsert for replay. Without the
+            # pre-image a new user can't be told apart yet, so the signup is
+            # recorded by signup_from_journal if the replayed upsert inserts.
+            await journaled_write(users_collection, "update_one", user_filter, user_update, upsert=True)
+            return
+        
+        if existing_user is None:
+            await record_signup({**user_filter, **user_update["$set"], **user_update["$setOnInsert"]}, now)
             
     except Exception as e:
         await send_error_to_support(
@@ -92,13 +146,11 @@ async def get_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await update.message.reply_text("❌ You don't have permission to use this command.")
             return
             
-        # Get statistics
-        total_users = await users_collection.count_documents({})
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        new_today = await users_collection.count_documents({"first_seen": {"$gte": today}})
-        
-        # Get top users by interaction count
-        top_users = await users_collection.find({}).sort("interaction_count", -1).limit(5).to_list(length=5)
+        # Get statistics from the maintained counters
+        snapshot = await stats.get_snapshot()
+        total_users = snapshot["total_users"]
+        new_today = snapshot["new_today"]
+        top_users = snapshot["top_users"]
         
         stats_text = f"📊 *User Statistics*\n\n"
         stats_text += f"• *Total Users:* {total_users}\n"
@@ -129,6 +181,37 @@ def setup(app: Application) -> None:
     # Override the default start handler with our enhanced version
     app.add_handler(CommandHandler("start", handle_start))
     app.add_handler(CommandHandler("userstats", get_user_stats))
+    on_replayed_upsert("users", signup_from_journal)
+
+async def prepare_indexes() -> None:
+    """
+    Merge user documents that share a user_id, left by concurrent /starts
+    from before user_id was unique, so the unique index can be built
+    """
+    duplicates = await users_collection.aggregate([
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}}
+    ]).to_list(length=None)
+    for duplicate in duplicates:
+        documents = await users_collection.find({"_id": {"$in": duplicate["ids"]}}).to_list(length=None)
+        # Keep the first registration, with the profile of the latest /start
+        documents.sort(key=lambda document: document.get("first_seen") or datetime.max)
+        keep = documents[0]
+        latest = max(documents, key=lambda document: document.get("last_seen") or datetime.min)
+        merged = {field: latest[field] for field in PROFILE_FIELDS if field in latest}
+        for document in documents[1:]:
+            for field, value in document.items():
+                if field not in keep and field not in merged and field != "_id":
+                    merged[field] = value
+        # Activity only ever updated one of them, so the counts add up
+        if any("interaction_count" in document for document in documents):
+            merged["interaction_count"] = sum(document.get("interaction_count", 0) for document in documents)
+        if any(document.get("signup_counted") for document in documents):
+            merged["signup_counted"] = True
+        if merged:
+            await users_collection.update_one({"_id": keep["_id"]}, {"$set": merged})
+        await users_collection.delete_many({"_id": {"$in": [document["_id"] for document in documents[1:]]}})
+        logger.info(f"Merged {len(documents)} user documents for user {duplicate['_id']}")
 
 async def test() -> None:
     """
@@ -136,12 +219,12 @@ async def test() -> None:
     """
     # Test database connection
     await db.command("ping")
-    
-    # Test that collections exist
-    collections = await db.list_collection_names()
-    if "users" not in collections:
-        # Create the collection if it doesn't exist
-        await users_collection.create_index("user_id", unique=True)
+
+async def startup(app: Application) -> None:
+    """
+    Seed the user counter from the collection the first time it is needed
+    """
+    await seed_sequence("users", await users_collection.estimated_document_count())
 
 def get_info() -> dict:
     """